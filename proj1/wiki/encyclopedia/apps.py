@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class EncyclopediaConfig(AppConfig):
     name = 'encyclopedia'
+
+    def ready(self):
+        # Connect signal receivers that keep the search, suggestion and link indexes in sync,
+        # and the one that starts the render cache warm-up
+        from . import links, search, suggest, warmup
@@ -0,0 +1,279 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from . import util
+
+
+def _datetime_from_timestamp(ts):
+    """ Converts a timestamp to a datetime, aware if USE_TZ is enabled. """
+    if settings.USE_TZ:
+        return datetime.fromtimestamp(ts, tz=timezone.utc)
+    return datetime.fromtimestamp(ts)
+
+
+class FileSystemBackend:
+    """
+    Stores each entry as a Markdown file `entries/<title>.md`
+    in Django's default storage (or the given `storage`).
+    On local storage, saves write a temporary file and atomically rename
+    it over the entry, so readers never see a missing or partial entry.
+    Set `WIKI_FSYNC = True` to flush saves to disk, once per batch.
+    """
+
+    # Editing an entry in place does not change the directory's mtime
+    version_tracks_edits = False
+
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else default_storage
+
+    def version(self):
+        """
+        Returns a value that changes whenever an entry is added or removed,
+        or None if the storage cannot tell.
+        """
+        try:
+            return self.storage.get_modified_time("entries")
+        except (FileNotFoundError, NotImplementedError):
+            return None
+
+    def list(self):
+        """ Returns the titles of all entries, in no particular order. """
+        _, filenames = self.storage.listdir("entries")
+        return [re.sub(r"\.md$", "", filename)
+                for filename in filenames if filename.endswith(".md")]
+
+    def get(self, title):
+        """ Returns the content of an entry, or None if it does not exist. """
+        try:
+            with self.storage.open(f"entries/{title}.md") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def save(self, title, content):
+        """ Creates or replaces an entry. """
+        self.save_many([(title, content, None)])
+
+    def save_many(self, entries):
+        """
+        Creates or replaces entries, given (title, content, timestamp) tuples.
+        A timestamp of None leaves the entry's modification time as now.
+        Raises SuspiciousFileOperation, before writing anything, if a title
+        could address a file outside of `entries/`.
+        """
+        entries = list(entries)
+        for title, _, _ in entries:
+            if not util.valid_title(title):
+                raise SuspiciousFileOperation(f"Invalid entry title: {title!r}")
+        try:
+            directory = self.storage.path("entries")
+        except NotImplementedError:
+            # Remote storages cannot rename, so replace entries in place
+            for title, content, _ in entries:
+                filename = f"entries/{title}.md"
+                if self.storage.exists(filename):
+                    self.storage.delete(filename)
+                self.storage.save(filename, ContentFile(content))
+            return
+
+        fsync = getattr(settings, "WIKI_FSYNC", False)
+        mode = getattr(self.storage, "file_permissions_mode", None) or 0o644
+        os.makedirs(directory, exist_ok=True)
+        pending = []
+        try:
+            for title, content, timestamp in entries:
+                # The storage checks the final path is inside its root
+                path = self.storage.path(f"entries/{title}.md")
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix=".entry.", suffix=".tmp")
+                pending.append((tmp, path, timestamp))
+                os.fchmod(fd, mode)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content.encode("utf-8"))
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            for tmp, path, timestamp in pending:
+                if timestamp is not None:
+                    os.utime(tmp, (timestamp, timestamp))
+                os.replace(tmp, path)
+        except BaseException:
+            # Leave no temporary files behind for entries that were not renamed
+            for tmp, _, _ in pending:
+                try:
+                    os.unlink(tmp)
+                except FileNotFoundError:
+                    pass
+            raise
+
+        # Make the renames themselves durable with a single directory sync
+        if fsync and pending:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def modified_time(self, title):
+        """
+        Returns the time an entry was last modified.
+        Raises FileNotFoundError if it does not exist.
+        """
+        return self.storage.get_modified_time(f"entries/{title}.md")
+
+    def modified_times(self):
+        """ Returns a dict of each entry's title to the time it was last modified. """
+        try:
+            directory = self.storage.path("entries")
+        except NotImplementedError:
+            return {title: self.modified_time(title) for title in self.list()}
+        tz = timezone.utc if settings.USE_TZ else None
+        times = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".md"):
+                    continue
+                try:
+                    times[entry.name[:-3]] = datetime.fromtimestamp(entry.stat().st_mtime, tz=tz)
+                except FileNotFoundError:
+                    pass
+        return times
+
+
+class SQLiteBackend:
+    """
+    Stores entries in a single SQLite database, with an FTS5 table
+    kept in sync by triggers for full-text search.
+    The database path is set by `WIKI_SQLITE_PATH`.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            title TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            modified REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            title, content, content='entries', content_rowid='rowid'
+        );
+        CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, title, content)
+                VALUES (new.rowid, new.title, new.content);
+            UPDATE meta SET value = value + 1 WHERE key = 'version';
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, title, content)
+                VALUES ('delete', old.rowid, old.title, old.content);
+            UPDATE meta SET value = value + 1 WHERE key = 'version';
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, title, content)
+                VALUES ('delete', old.rowid, old.title, old.content);
+            INSERT INTO entries_fts (rowid, title, content)
+                VALUES (new.rowid, new.title, new.content);
+        END;
+        -- A trigger of its own, so databases created before it also get it
+        CREATE TRIGGER IF NOT EXISTS entries_au_version AFTER UPDATE ON entries BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'version';
+        END;
+    """
+
+    version_tracks_edits = True
+
+    def __init__(self, path=None):
+        if path is None:
+            path = getattr(settings, "WIKI_SQLITE_PATH", None)
+        if path is None:
+            path = os.path.join(settings.BASE_DIR, "entries.sqlite3")
+        self.path = path
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def connection(self):
+        """ Returns this thread's connection to the database. """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self):
+        """ Returns a counter bumped by every entry insert, update or delete. """
+        row = self.connection().execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0]
+
+    def list(self):
+        """ Returns the titles of all entries, in no particular order. """
+        return [row[0] for row in self.connection().execute("SELECT title FROM entries")]
+
+    def get(self, title):
+        """ Returns the content of an entry, or None if it does not exist. """
+        row = self.connection().execute(
+            "SELECT content FROM entries WHERE title = ?", (title,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save(self, title, content):
+        """ Creates or replaces an entry in a single transaction. """
+        self.save_many([(title, content, None)])
+
+    def save_many(self, entries):
+        """
+        Creates or replaces entries in a single transaction, given
+        (title, content, timestamp) tuples. A timestamp of None means now.
+        """
+        now = time.time()
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT INTO entries (title, content, modified) VALUES (?, ?, ?) "
+                "ON CONFLICT (title) DO UPDATE SET "
+                "content = excluded.content, modified = excluded.modified",
+                ((title, content, now if timestamp is None else timestamp)
+                 for title, content, timestamp in entries))
+
+    def modified_time(self, title):
+        """
+        Returns the time an entry was last modified.
+        Raises FileNotFoundError if it does not exist.
+        """
+        row = self.connection().execute(
+            "SELECT modified FROM entries WHERE title = ?", (title,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(title)
+        return _datetime_from_timestamp(row[0])
+
+    def modified_times(self):
+        """ Returns a dict of each entry's title to the time it was last modified. """
+        return {title: _datetime_from_timestamp(modified) for title, modified in
+                self.connection().execute("SELECT title, modified FROM entries")}
+
+    def search(self, query, limit):
+        """
+        Full-text search using the FTS5 table, ranked by BM25.
+        Returns the titles of up to `limit` matching entries, best match first.
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " OR ".join('"{}"'.format(term) for term in terms)
+        rows = self.connection().execute(
+            "SELECT title FROM entries_fts WHERE entries_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit))
+        return [row[0] for row in rows]
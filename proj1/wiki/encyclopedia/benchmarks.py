@@ -0,0 +1,208 @@
+"""
+Benchmark harness for the encyclopedia app.
+
+Generates synthetic corpora in a scratch directory and drives the views
+through the Django test client, recording latency percentiles, file
+system calls and memory for each operation.
+"""
+import builtins
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from markdown2 import markdown
+
+from . import links, search, suggest, util
+from .backends import FileSystemBackend
+
+WORDS = (
+    "alpha beta gamma delta web server client request response cache index "
+    "python django html css markdown storage database query search page link "
+    "history language network protocol browser render template module import"
+).split()
+
+# Functions counted as system calls while an operation runs
+SYSCALLS = [
+    (os, "stat"), (os, "lstat"), (os, "scandir"), (os, "listdir"),
+    (os, "open"), (os, "replace"), (builtins, "open"),
+]
+
+
+def generate_corpus(size, seed=0):
+    """ Yields `size` reproducible (title, content) pairs that link to each other. """
+    rng = random.Random(seed)
+    titles = [f"{rng.choice(WORDS).title()} {i}" for i in range(size)]
+    for title in titles:
+        paragraphs = []
+        for _ in range(rng.randint(1, 5)):
+            words = rng.choices(WORDS, k=rng.randint(20, 80))
+            link = rng.choice(titles)
+            words.append(f"[{link}](/wiki/{link})")
+            paragraphs.append(" ".join(words))
+        yield title, f"# {title}\n\n" + "\n\n".join(paragraphs) + "\n"
+
+
+@contextmanager
+def count_syscalls(counter):
+    """ Counts calls to the functions in SYSCALLS into `counter` while active. """
+    originals = [(module, name, getattr(module, name)) for module, name in SYSCALLS]
+
+    def counted(name, function):
+        def wrapper(*args, **kwargs):
+            counter[name] = counter.get(name, 0) + 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    for module, name, function in originals:
+        setattr(module, name, counted(name, function))
+    try:
+        yield counter
+    finally:
+        for module, name, function in originals:
+            setattr(module, name, function)
+
+
+def reset_state():
+    """ Discards the process-wide indexes and caches so a new corpus starts cold. """
+    util._backend = None
+    util._index = util.EntryIndex()
+    util._renders = util.RenderCache()
+    search._search_index = None
+    suggest._suggester = suggest.TitleSuggester()
+    links._graph = links.LinkGraph()
+
+
+def percentile(samples, p):
+    """ Returns the `p`th percentile of sorted `samples`. """
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def measure(operation, repeat):
+    """
+    Calls `operation(i)` `repeat` times and returns latency percentiles
+    (in milliseconds) and average system calls per call.
+    """
+    timings = []
+    counter = {}
+    with count_syscalls(counter):
+        for i in range(repeat):
+            start = time.perf_counter()
+            operation(i)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "calls": repeat,
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+        "max_ms": timings[-1],
+        "syscalls_per_call": {name: count / repeat for name, count in sorted(counter.items())},
+    }
+
+
+def benchmark_corpus(size, repeat, seed=0, log=None):
+    """ Generates a corpus of `size` entries and measures each operation against it. """
+    rng = random.Random(seed)
+    client = Client()
+    results = {"size": size}
+
+    with tempfile.TemporaryDirectory() as root, override_settings(
+        MEDIA_ROOT=root,
+        WIKI_ENTRY_BACKEND="encyclopedia.backends.FileSystemBackend",
+        WIKI_SEARCH_INDEX=os.path.join(root, "search.index"),
+    ):
+        reset_state()
+        start = time.perf_counter()
+        corpus = list(generate_corpus(size, seed))
+        FileSystemBackend().save_many((title, content, None) for title, content in corpus)
+        results["generate_s"] = time.perf_counter() - start
+        titles = [title for title, _ in corpus]
+        del corpus
+
+        # Memory held by the indexes once they are built from a cold start
+        tracemalloc.start()
+        start = time.perf_counter()
+        util.list_entries()
+        search.get_index().rank("", 1)
+        suggest.suggest("a")
+        links.backlinks("")
+        results["build_indexes_s"] = time.perf_counter() - start
+        results["index_memory_bytes"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        sample = [rng.choice(titles) for _ in range(repeat)]
+        queries = [" ".join(rng.sample(WORDS, 2)) for _ in range(repeat)]
+        search_limit = getattr(settings, "WIKI_SEARCH_RESULTS", 20)
+        etags = [f'"{util.entry_etag(title)}"' for title in sample]
+        operations = [
+            ("util.list_entries", lambda i: util.list_entries()),
+            ("util.get_entry", lambda i: util.get_entry(sample[i])),
+            ("markdown render", lambda i: markdown(util.get_entry(sample[i]))),
+            ("view index", lambda i: client.get(reverse("index"))),
+            ("view contents (cold)", lambda i: client.get(reverse("contents", args=[sample[i]]))),
+            ("view contents (warm)", lambda i: client.get(reverse("contents", args=[sample[i]]))),
+            ("view contents (304)", lambda i: client.get(
+                reverse("contents", args=[sample[i]]), HTTP_IF_NONE_MATCH=etags[i])),
+            ("search rank (1 term)", lambda i: search.get_index().rank(queries[i].split()[0], search_limit)),
+            ("search rank (2 terms)", lambda i: search.get_index().rank(queries[i], search_limit)),
+            ("view search (full text)", lambda i: client.get(reverse("search"), {"q": queries[i]})),
+            ("view search (exact title)", lambda i: client.get(reverse("search"), {"q": sample[i].lower()})),
+            ("view random", lambda i: client.get(reverse("random"))),
+            ("view suggest", lambda i: client.get(reverse("suggest"), {"q": sample[i][:4]})),
+        ]
+        results["operations"] = {}
+        for name, operation in operations:
+            results["operations"][name] = measure(operation, repeat)
+            if log is not None:
+                stats = results["operations"][name]
+                log(f"{size:>7} {name:<26} p50 {stats['p50_ms']:8.3f}ms  "
+                    f"p99 {stats['p99_ms']:8.3f}ms  "
+                    f"syscalls {sum(stats['syscalls_per_call'].values()):6.1f}")
+        reset_state()
+    return results
+
+
+def git_commit():
+    """ Returns the current git commit of the working tree, if there is one. """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat, seed=0, log=None):
+    """ Benchmarks each corpus size and returns the results as a JSON-serializable dict. """
+    # The test client needs the test environment, unless the test runner already set it up
+    try:
+        setup_test_environment()
+        own_environment = True
+    except RuntimeError:
+        own_environment = False
+    try:
+        corpora = [benchmark_corpus(size, repeat, seed, log) for size in sizes]
+    finally:
+        if own_environment:
+            teardown_test_environment()
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "django": django.get_version(),
+        "repeat": repeat,
+        "seed": seed,
+        "corpora": corpora,
+    }
@@ -1,11 +1,19 @@
 from django import forms
 
+from . import util
+
 
 class NewPageForm(forms.Form):
     """ Form containing `title` and `contents` field to create a new page. """
     title = forms.CharField(label="Title of page:", max_length=32)
     contents = forms.CharField(label="Contents of page: ", widget=forms.Textarea)
 
+    def clean_title(self):
+        title = self.cleaned_data["title"]
+        if not util.valid_title(title):
+            raise forms.ValidationError("Titles cannot contain slashes or \"..\".")
+        return title
+
 
 class EditForm(forms.Form):
     """ Form containing `contents` field to edit an existing page. """
@@ -0,0 +1,157 @@
+import hashlib
+import re
+import threading
+import time
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import util
+from .signals import entries_saved
+
+# Markdown links to other entries, e.g. [HTML](/wiki/HTML)
+LINK_RE = re.compile(r"\]\(\s*/wiki/([^)\s]+)\s*\)")
+
+
+def extract_links(content):
+    """ Returns the set of entry titles linked to from Markdown `content`. """
+    return {unquote(target) for target in LINK_RE.findall(content)}
+
+
+class LinkGraph:
+    """
+    Adjacency index of the links between entries, in both directions.
+    Built from every entry on first use, then updated from saved entries.
+    Entries added, removed or edited by other processes (or outside of
+    `save_entry`) are found by comparing every entry's modification time,
+    and only those are parsed again. That check runs whenever the backend's
+    version changes. Backends whose version does not move when an entry is
+    edited in place (files, where only adding or removing an entry changes
+    the directory) are also checked every `WIKI_LINKS_RESCAN_INTERVAL`
+    seconds, so such edits show up in backlinks within that time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.built = False
+        self.version = None     # backend version at the last check
+        self.rescan_at = 0      # time.monotonic() after which entries are checked again
+        self.mtimes = {}        # title -> modification time its links were extracted at
+        self.outgoing = {}      # title -> set of linked titles
+        self.incoming = {}      # title -> set of titles linking to it
+        self.changed = {}       # title -> when its backlinks last changed
+
+    def _set_links(self, title, targets):
+        previous = self.outgoing.get(title, set())
+        for target in previous:
+            sources = self.incoming[target]
+            sources.discard(title)
+            if not sources:
+                del self.incoming[target]
+        if targets is None:
+            self.outgoing.pop(title, None)
+            targets = set()
+        else:
+            self.outgoing[title] = targets
+            for target in targets:
+                self.incoming.setdefault(target, set()).add(title)
+
+        # Only saves after the initial build can change what a cached page showed
+        if self.built:
+            now = timezone.now()
+            for target in previous ^ targets:
+                self.changed[target] = now
+
+    def _refresh(self):
+        backend = util.get_backend()
+        version = backend.version()
+        if self.built and version is not None and version == self.version:
+            if getattr(backend, "version_tracks_edits", False) or time.monotonic() < self.rescan_at:
+                return
+        mtimes = util.entry_modified_times()
+        for title in set(self.outgoing) - mtimes.keys():
+            self._set_links(title, None)
+            self.mtimes.pop(title, None)
+        for title, mtime in mtimes.items():
+            if title in self.outgoing and self.mtimes.get(title) == mtime:
+                continue
+            content = util.get_entry(title)
+            if content is not None:
+                self._set_links(title, extract_links(content))
+                self.mtimes[title] = mtime
+        self.built = True
+        self.version = version
+        self.rescan_at = time.monotonic() + getattr(settings, "WIKI_LINKS_RESCAN_INTERVAL", 1)
+
+    def update(self, entries):
+        """ Re-extracts the links of saved entries, given a dict of title to content. """
+        with self._lock:
+            if not self.built:
+                return
+            for title, content in entries.items():
+                self._set_links(title, extract_links(content))
+                # Read again on the next refresh, in case another process saved it since
+                self.mtimes.pop(title, None)
+            self._refresh()
+
+    def backlinks(self, title):
+        """ Returns the sorted titles of entries linking to `title`. """
+        with self._lock:
+            self._refresh()
+            return sorted(self.incoming.get(title, set()) - {title})
+
+    def backlinks_changed(self, title):
+        """ Returns when the backlinks of `title` last changed in this process, if ever. """
+        with self._lock:
+            return self.changed.get(title)
+
+    def orphans(self):
+        """ Returns the sorted titles of entries no other entry links to. """
+        with self._lock:
+            self._refresh()
+            return sorted(title for title in self.outgoing
+                          if not self.incoming.get(title, set()) - {title})
+
+    def dead_links(self):
+        """ Returns a dict of each entry with links to missing entries, to those titles. """
+        with self._lock:
+            self._refresh()
+            return {title: sorted(targets - self.outgoing.keys())
+                    for title, targets in sorted(self.outgoing.items())
+                    if targets - self.outgoing.keys()}
+
+
+_graph = LinkGraph()
+
+
+def backlinks(title):
+    """ Returns the sorted titles of entries linking to `title`. """
+    return _graph.backlinks(title)
+
+
+def backlinks_etag(title):
+    """ Returns a hash of the entries linking to `title`, for validating cached pages. """
+    return hashlib.sha256("\n".join(backlinks(title)).encode("utf-8")).hexdigest()[:16]
+
+
+def backlinks_changed(title):
+    """ Returns when the backlinks of `title` last changed, if they did since startup. """
+    return _graph.backlinks_changed(title)
+
+
+def orphans():
+    """ Returns the sorted titles of entries no other entry links to. """
+    return _graph.orphans()
+
+
+def dead_links():
+    """ Returns a dict of each entry with links to missing entries, to those titles. """
+    return _graph.dead_links()
+
+
+@receiver(entries_saved)
+def update_links(sender, entries, **kwargs):
+    """ Keeps the link graph in sync with saved entries. """
+    _graph.update(entries)
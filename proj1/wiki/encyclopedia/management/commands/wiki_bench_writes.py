@@ -0,0 +1,79 @@
+import tempfile
+import threading
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from encyclopedia.backends import FileSystemBackend
+
+# Every version of a benchmark entry ends with this line, so a partial read is detectable
+END = "\n<!-- end -->\n"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures entry write throughput under concurrent edits and reads, "
+        "in a scratch directory, and counts readers that saw a missing or partial entry."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--entries", type=int, default=20,
+                            help="Number of distinct entries edited concurrently")
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--batch-size", type=int, default=1,
+                            help="Entries written per save (fsyncs are batched per save)")
+        parser.add_argument("--fsync", action="store_true", help="Benchmark with WIKI_FSYNC enabled")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as root, override_settings(WIKI_FSYNC=options["fsync"]):
+            backend = FileSystemBackend(FileSystemStorage(location=root))
+            titles = [f"Bench{i}" for i in range(options["entries"])]
+            backend.save_many([(title, f"# {title}{END}", None) for title in titles])
+
+            stop = threading.Event()
+            writes = [0] * options["writers"]
+            reads = [0] * options["readers"]
+            errors = [0] * options["readers"]
+
+            def write(worker):
+                batch_size = options["batch_size"]
+                i = worker
+                while not stop.is_set():
+                    content = f"# Edit {i} by {worker}\n" + "x" * (i % 4096) + END
+                    batch = [(titles[(i + j) % len(titles)], content, None)
+                             for j in range(batch_size)]
+                    backend.save_many(batch)
+                    writes[worker] += batch_size
+                    i += 1
+
+            def read(worker):
+                i = worker
+                while not stop.is_set():
+                    content = backend.get(titles[i % len(titles)])
+                    if content is None or not content.endswith(END):
+                        errors[worker] += 1
+                    reads[worker] += 1
+                    i += 1
+
+            threads = ([threading.Thread(target=write, args=(i,)) for i in range(options["writers"])] +
+                       [threading.Thread(target=read, args=(i,)) for i in range(options["readers"])])
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(options["seconds"])
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"writes:            {sum(writes)} ({sum(writes) / elapsed:.0f}/s)")
+        self.stdout.write(f"reads:             {sum(reads)} ({sum(reads) / elapsed:.0f}/s)")
+        self.stdout.write(f"missing/partial:   {sum(errors)}")
+        if sum(errors):
+            self.stdout.write(self.style.ERROR("Readers saw missing or partial entries."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Readers always saw a complete entry."))
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from encyclopedia import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks list_entries, get_entry, Markdown rendering and the wiki views "
+        "against synthetic corpora, and saves the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                            help="Corpus sizes to generate")
+        parser.add_argument("--repeat", type=int, default=200,
+                            help="Calls measured per operation and corpus")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="wiki-benchmark.json",
+                            help="File to save the JSON results to")
+
+    def handle(self, *args, **options):
+        results = benchmarks.run(options["sizes"], options["repeat"], options["seed"],
+                                 log=self.stdout.write)
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}."))
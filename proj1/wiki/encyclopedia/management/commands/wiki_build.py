@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+
+import django
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.urls import reverse
+from markdown2 import markdown
+
+from encyclopedia import links, util
+
+MANIFEST = ".wiki_build.json"
+
+
+def page_path(output, url):
+    """ Returns the file a page at `url` is written to, e.g. `/wiki/CSS` -> `wiki/CSS.html`. """
+    path = unquote(url).lstrip("/")
+    path += "index.html" if path.endswith("/") or not path else ".html"
+    return os.path.join(output, path)
+
+
+def write_page(path, html):
+    """ Writes a page atomically so a web server never serves a partial file. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(html)
+    os.replace(tmp, path)
+
+
+def build_entries(output, entries):
+    """
+    Renders the entries whose content or backlinks changed, given
+    (title, manifest record, backlinks) tuples. Runs in a worker process.
+    Returns the new manifest record of each entry and the number of pages written.
+    """
+    records = {}
+    written = 0
+    for title, previous, backlinks in entries:
+        backlinks_digest = hashlib.sha256("\n".join(backlinks).encode("utf-8")).hexdigest()
+        try:
+            mtime = util.entry_modified_time(title).timestamp()
+        except (FileNotFoundError, NotImplementedError):
+            mtime = None
+        if (previous is not None and mtime is not None and previous["mtime"] == mtime
+                and previous.get("backlinks") == backlinks_digest):
+            records[title] = previous
+            continue
+
+        content = util.get_entry(title)
+        if content is None:
+            continue
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if (previous is None or previous["digest"] != digest
+                or previous.get("backlinks") != backlinks_digest):
+            html = render_to_string("encyclopedia/contents.html", {
+                "title": title,
+                "contents": markdown(content),
+                "backlinks": backlinks
+            })
+            write_page(page_path(output, reverse("contents", args=[title])), html)
+            written += 1
+        records[title] = {"mtime": mtime, "digest": digest, "backlinks": backlinks_digest}
+    return records, written
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders every wiki entry into a static HTML site. Only entries whose content "
+        "or backlinks changed since the last build are rendered again. Serve the output directory "
+        "with e.g. nginx `try_files $uri $uri.html =404;`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Directory to write the site to")
+        parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                            help="Number of worker processes rendering entries")
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Number of entries handed to a worker at a time")
+        parser.add_argument("--force", action="store_true", help="Render every entry again")
+
+    def handle(self, *args, **options):
+        output = os.path.abspath(options["output"])
+        manifest_path = os.path.join(output, MANIFEST)
+        manifest = {}
+        if not options["force"]:
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+        os.makedirs(output, exist_ok=True)
+
+        start = time.perf_counter()
+        titles = util.list_entries()
+        chunk_size = options["chunk_size"]
+        chunks = [[(title, manifest.get("entries", {}).get(title), links.backlinks(title))
+                   for title in titles[i:i + chunk_size]]
+                  for i in range(0, len(titles), chunk_size)]
+
+        # Render entries in parallel, then the index page in this process
+        records = {}
+        written = 0
+        with ProcessPoolExecutor(max_workers=options["jobs"], initializer=django.setup) as pool:
+            for chunk_records, chunk_written in pool.map(build_entries, [output] * len(chunks), chunks):
+                records.update(chunk_records)
+                written += chunk_written
+
+        index_etag = util.index_etag()
+        if manifest.get("index") != index_etag:
+            html = render_to_string("encyclopedia/index.html", {"entries": titles})
+            write_page(page_path(output, reverse("index")), html)
+            written += 1
+
+        # Remove pages of entries that no longer exist
+        removed = set(manifest.get("entries", {})) - set(records)
+        for title in removed:
+            try:
+                os.remove(page_path(output, reverse("contents", args=[title])))
+            except FileNotFoundError:
+                pass
+
+        with open(manifest_path, "w") as f:
+            json.dump({"index": index_etag, "entries": records}, f)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {len(records)} entries into {output} in {elapsed:.2f}s: "
+            f"{written} pages written, {len(removed)} removed."))
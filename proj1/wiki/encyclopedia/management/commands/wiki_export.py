@@ -0,0 +1,65 @@
+import io
+import json
+import sys
+import tarfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from encyclopedia import util
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams every wiki entry to a JSONL file or a tarball of <title>.md files, "
+        "one entry at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("destination", help="File to write, or - for standard output")
+        parser.add_argument("--format", choices=["jsonl", "tar"],
+                            help="Output format (default: guessed from the file name)")
+
+    def handle(self, *args, **options):
+        destination = options["destination"]
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "jsonl" if destination.endswith((".jsonl", ".json")) or destination == "-" else "tar"
+
+        start = time.perf_counter()
+        count = 0
+        if fmt == "jsonl":
+            f = sys.stdout if destination == "-" else open(destination, "w", encoding="utf-8")
+            try:
+                for title, content in self.entries():
+                    f.write(json.dumps({"title": title, "content": content}) + "\n")
+                    count += 1
+            finally:
+                if destination != "-":
+                    f.close()
+        else:
+            # Compress according to the file extension, e.g. `wiki.tar.gz`
+            compression = "gz" if destination.endswith(("gz", ".tgz")) else ""
+            f = sys.stdout.buffer if destination == "-" else open(destination, "wb")
+            try:
+                with tarfile.open(fileobj=f, mode=f"w|{compression}") as tar:
+                    for title, content in self.entries():
+                        data = content.encode("utf-8")
+                        info = tarfile.TarInfo(f"entries/{title}.md")
+                        info.size = len(data)
+                        info.mtime = util.entry_modified_time(title).timestamp()
+                        tar.addfile(info, io.BytesIO(data))
+                        count += 1
+            finally:
+                if destination != "-":
+                    f.close()
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(f"Exported {count} entries in {elapsed:.2f}s.")
+
+    def entries(self):
+        """ Yields (title, content) pairs, reading one entry at a time. """
+        for title in util.list_entries():
+            content = util.get_entry(title)
+            if content is not None:
+                yield title, content
@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+import tarfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from encyclopedia import util
+
+
+def read_jsonl(f):
+    """ Yields (title, content) pairs from JSON lines of {"title": ..., "content": ...}. """
+    for number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            yield entry["title"], entry["content"]
+        except (ValueError, KeyError, TypeError):
+            raise CommandError(f"Line {number} is not a JSON object with a title and content.")
+
+
+def read_tar(f):
+    """ Yields (title, content) pairs from the `.md` files of a tar stream. """
+    with tarfile.open(fileobj=f, mode="r|*") as tar:
+        for member in tar:
+            name = os.path.basename(member.name)
+            if member.isfile() and name.endswith(".md"):
+                content = tar.extractfile(member).read().decode("utf-8")
+                yield name[:-len(".md")], content
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams entries into the wiki from a JSONL file or a tarball of "
+        "<title>.md files, saving them in batches. Entries whose titles the "
+        "create page would refuse, such as ones containing slashes, are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="File to import, or - for standard input")
+        parser.add_argument("--format", choices=["jsonl", "tar"],
+                            help="Input format (default: guessed from the file name)")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of entries saved per batch")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "jsonl" if source.endswith((".jsonl", ".json")) or source == "-" else "tar"
+
+        if fmt == "jsonl":
+            f = sys.stdin if source == "-" else open(source, encoding="utf-8")
+            entries = read_jsonl(f)
+        else:
+            f = sys.stdin.buffer if source == "-" else open(source, "rb")
+            entries = read_tar(f)
+
+        start = time.perf_counter()
+        count = 0
+        skipped = 0
+        batch = []
+        try:
+            for title, content in entries:
+                if not (isinstance(title, str) and isinstance(content, str) and util.valid_title(title)):
+                    self.stderr.write(self.style.WARNING(f"Skipped entry with invalid title {title!r}."))
+                    skipped += 1
+                    continue
+                batch.append((title, content))
+                if len(batch) >= options["batch_size"]:
+                    util.save_entries(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                util.save_entries(batch)
+                count += len(batch)
+        finally:
+            if source != "-":
+                f.close()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {count} entries in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f}/s)"
+            + (f", skipped {skipped} with invalid titles." if skipped else ".")))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from encyclopedia import links
+
+
+class Command(BaseCommand):
+    help = "Reports orphan entries, which nothing links to, and links to entries that do not exist."
+
+    def handle(self, *args, **options):
+        orphans = links.orphans()
+        self.stdout.write(f"Orphans ({len(orphans)}):")
+        for title in orphans:
+            self.stdout.write(f"  {title}")
+
+        dead_links = links.dead_links()
+        self.stdout.write(f"Entries with dead links ({len(dead_links)}):")
+        for title, targets in dead_links.items():
+            self.stdout.write(f"  {title} -> {', '.join(targets)}")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from encyclopedia.backends import FileSystemBackend, SQLiteBackend
+
+
+class Command(BaseCommand):
+    help = "Copies the entries/ directory into the SQLite entry backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", help="SQLite file to migrate into (default: WIKI_SQLITE_PATH)")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of entries saved per transaction")
+
+    def handle(self, *args, **options):
+        source = FileSystemBackend()
+        target = SQLiteBackend(options["database"])
+        batch_size = options["batch_size"]
+
+        # Stream entries across in batches, keeping each file's modification time
+        batch = []
+        count = 0
+        for title in source.list():
+            content = source.get(title)
+            if content is None:
+                continue
+            batch.append((title, content, source.modified_time(title).timestamp()))
+            if len(batch) >= batch_size:
+                target.save_many(batch)
+                count += len(batch)
+                batch = []
+        target.save_many(batch)
+        count += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Migrated {count} entries into {target.path}. "
+            "Set WIKI_ENTRY_BACKEND = \"encyclopedia.backends.SQLiteBackend\" to use it."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from encyclopedia import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-renders entries in a process pool the way the WIKI_WARMUP startup stage does "
+        "and reports the throughput achieved. It only measures: the renders are cached in "
+        "this command's process and do not warm a running server, which warms itself when "
+        "WIKI_WARMUP is set. Use it to check every entry renders and to size WIKI_WARMUP_WORKERS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int,
+                            help="Only render the N most requested entries (the first N without WIKI_HITS_FILE)")
+        parser.add_argument("--workers", type=int, help="Number of worker processes")
+
+    def handle(self, *args, **options):
+        count, elapsed = warmup.warm(top=options["top"], workers=options["workers"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {count} entries in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f}/s)."))
@@ -0,0 +1,373 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from . import util
+from .signals import entries_saved
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshot and journal writes are not locked across processes
+    fcntl = None
+
+# Okapi BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Minimum number of journaled updates before the snapshot is rewritten.
+# Larger indexes wait until the journal is as long as the index itself,
+# so bulk imports rewrite the snapshot a logarithmic number of times.
+COMPACT_AFTER = 1000
+
+SNIPPET_LENGTH = 160
+
+
+def tokenize(text):
+    """ Splits text into case-folded word tokens. """
+    return re.findall(r"\w+", text.casefold())
+
+
+class SearchIndex:
+    """
+    Inverted index over entry titles and bodies, ranked with BM25.
+    The index is persisted as a pickled snapshot plus an append-only
+    journal of updates, so a restart only replays what changed since
+    the last snapshot. The journal is shared by every process serving
+    the wiki: whenever the backend's version changes, as in
+    `EntryIndex.refresh`, each process replays the records the others
+    appended and indexes entries added or removed outside of `save_entry`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._backend_version = None
+        self._journaled = 0
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._missed = False
+        self.docs = {}          # title -> (mtime, length, terms)
+        self.postings = {}      # term -> {title: term frequency}
+        self.total_length = 0
+        self.impact = {}        # term -> titles in its posting, highest scoring first
+
+    @property
+    def journal_path(self):
+        return f"{self.path}.journal"
+
+    @contextmanager
+    def _file_lock(self):
+        """ Serializes reading and writing the snapshot and journal across processes. """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _mtime(self, title):
+        try:
+            return util.entry_modified_time(title)
+        except FileNotFoundError:
+            return None
+
+    def _add(self, title, content, mtime):
+        self._remove(title)
+        freqs = Counter(tokenize(title) + tokenize(content))
+        length = sum(freqs.values())
+        for term, tf in freqs.items():
+            self.postings.setdefault(term, {})[title] = tf
+        self.docs[title] = (mtime, length, tuple(freqs))
+        self.total_length += length
+        self.impact.clear()
+
+    def _remove(self, title):
+        doc = self.docs.pop(title, None)
+        if doc is None:
+            return
+        _, length, terms = doc
+        for term in terms:
+            posting = self.postings[term]
+            del posting[title]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= length
+        self.impact.clear()
+
+    def _load(self):
+        """ Loads the snapshot and journal on first use, then reconciles with storage. """
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.path is not None:
+            with self._file_lock():
+                try:
+                    with open(self.path, "rb") as f:
+                        self.docs, self.postings, self.total_length = pickle.load(f)
+                except FileNotFoundError:
+                    pass
+                except Exception:
+                    # A truncated snapshot or one from an older version is rebuilt
+                    self.docs, self.postings, self.total_length = {}, {}, 0
+                self._read_journal()
+        # Entries may have been edited in any way while no process was running
+        self._missed = True
+        if self._sync():
+            self._compact()
+
+    def _read_journal(self):
+        """
+        Applies the journal records appended since this process last read
+        it, such as other processes' saves. If another process compacted the
+        index since, records may have been missed and the next `_sync` checks
+        every entry. Call with the file lock held.
+        """
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            return False
+        changed = False
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode == self._journal_inode:
+                f.seek(self._journal_offset)
+            elif self._journal_inode is not None:
+                self._missed = True
+            self._journal_inode = inode
+            self._journal_offset = f.tell()
+            try:
+                while True:
+                    self._add(*pickle.load(f))
+                    self._journal_offset = f.tell()
+                    changed = True
+            except Exception:
+                # End of the journal, or a record cut short by a crash
+                pass
+        return changed
+
+    def _sync(self):
+        """
+        Brings the index up to date with storage if the backend's version
+        changed since the last check: replays the journal, then indexes
+        entries added or removed by any other means. Entries are only
+        checked for edits one by one after records may have been missed.
+        Returns whether the index changed.
+        """
+        version = util.get_backend().version()
+        if version is not None and version == self._backend_version and not self._missed:
+            return False
+        changed = False
+        if self.path is not None:
+            with self._file_lock():
+                changed = self._read_journal()
+
+        missed, self._missed = self._missed, False
+        titles = set(util.list_entries())
+        for title in set(self.docs) - titles:
+            self._remove(title)
+            changed = True
+        for title in titles:
+            doc = self.docs.get(title)
+            if doc is not None and not missed:
+                continue
+            mtime = self._mtime(title)
+            if doc is None or doc[0] != mtime:
+                content = util.get_entry(title)
+                if content is not None:
+                    self._add(title, content, mtime)
+                    changed = True
+        self._backend_version = version
+        return changed
+
+    def _compact(self):
+        """
+        Writes a fresh snapshot, including any records other processes
+        journaled meanwhile, and starts a new empty journal.
+        """
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._file_lock():
+            self._read_journal()
+            for path, data in [
+                (self.path, (self.docs, self.postings, self.total_length)),
+                (self.journal_path, None),
+            ]:
+                fd, tmp = tempfile.mkstemp(dir=directory, prefix=".search.", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        if data is not None:
+                            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp, path)
+                except BaseException:
+                    try:
+                        os.unlink(tmp)
+                    except FileNotFoundError:
+                        pass
+                    raise
+            # Other processes see the new journal's inode and check every entry once
+            self._journal_inode = os.stat(self.journal_path).st_ino
+            self._journal_offset = 0
+        self._journaled = 0
+
+    def update(self, entries):
+        """ Indexes saved entries, given a dict of title to content. """
+        with self._lock:
+            if not self._loaded:
+                # Loading reads the new content from storage anyway
+                self._load()
+                return
+            records = [(title, content, self._mtime(title))
+                       for title, content in entries.items()]
+            for record in records:
+                self._add(*record)
+            if self.path is None:
+                return
+            self._journaled += len(records)
+            if self._journaled >= max(COMPACT_AFTER, len(self.docs)):
+                self._compact()
+                return
+            with self._file_lock():
+                # Catch up with other processes first, so the offset then ends after these records
+                self._read_journal()
+                with open(self.journal_path, "ab") as f:
+                    f.write(b"".join(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+                                     for record in records))
+                    self._journal_offset = f.tell()
+                self._journal_inode = os.stat(self.journal_path).st_ino
+
+    def rank(self, query, limit):
+        """
+        Returns up to `limit` (title, score) pairs best matching `query`.
+        Each term's posting is walked in order of its score (sorted once per
+        change to the index), and the walk stops as soon as no entry not yet
+        seen can beat the `limit`th best, so common terms do not score every entry.
+        """
+        with self._lock:
+            self._load()
+            self._sync()
+            n = len(self.docs)
+            terms = [term for term in set(tokenize(query)) if term in self.postings]
+            if n == 0 or not terms or limit <= 0:
+                return []
+            avg_length = self.total_length / n
+            idf = {
+                term: math.log(1 + (n - len(self.postings[term]) + 0.5) / (len(self.postings[term]) + 0.5))
+                for term in terms
+            }
+
+            def term_score(term, title):
+                tf = self.postings[term].get(title)
+                if tf is None:
+                    return 0.0
+                length = self.docs[title][1]
+                return idf[term] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+            for term in terms:
+                if term not in self.impact:
+                    self.impact[term] = sorted(
+                        self.postings[term], key=lambda title: term_score(term, title), reverse=True)
+
+            # Threshold algorithm: an entry not seen by depth d scores at most
+            # the sum of the scores at depth d of every term's posting
+            best = []       # min-heap of (score, title)
+            seen = set()
+            for depth in range(max(len(self.impact[term]) for term in terms)):
+                threshold = 0.0
+                for term in terms:
+                    order = self.impact[term]
+                    if depth >= len(order):
+                        continue
+                    title = order[depth]
+                    threshold += term_score(term, title)
+                    if title in seen:
+                        continue
+                    seen.add(title)
+                    score = sum(term_score(other, title) for other in terms)
+                    if len(best) < limit:
+                        heapq.heappush(best, (score, title))
+                    elif score > best[0][0]:
+                        heapq.heapreplace(best, (score, title))
+                if len(best) >= limit and best[0][0] >= threshold:
+                    break
+            return [(title, score) for score, title in sorted(best, reverse=True)]
+
+
+def snippet(content, query):
+    """ Returns a short plain-text excerpt of `content` around the first query term. """
+    text = re.sub(r"[#*_`>\[\]]|\(/wiki/[^)]*\)", "", content)
+    text = re.sub(r"\s+", " ", text).strip()
+    folded = text.casefold()
+    positions = [folded.find(term) for term in tokenize(query)]
+    positions = [position for position in positions if position >= 0]
+    start = max(min(positions, default=0) - SNIPPET_LENGTH // 4, 0)
+    excerpt = text[start:start + SNIPPET_LENGTH]
+    if start > 0:
+        excerpt = "..." + excerpt
+    if start + SNIPPET_LENGTH < len(text):
+        excerpt += "..."
+    return excerpt
+
+
+def _index_path():
+    path = getattr(settings, "WIKI_SEARCH_INDEX", None)
+    if path is None and hasattr(settings, "BASE_DIR"):
+        path = os.path.join(settings.BASE_DIR, "search.index")
+    return path
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_index():
+    """ Returns the process-wide search index, creating it on first use. """
+    global _search_index
+    with _search_index_lock:
+        if _search_index is None:
+            _search_index = SearchIndex(_index_path())
+        return _search_index
+
+
+def search(query, limit=None):
+    """
+    Full-text search over encyclopedia entries.
+    Returns a list of up to `limit` dicts with the `title` and a `snippet`
+    of each matching entry, best match first.
+    """
+    if limit is None:
+        limit = getattr(settings, "WIKI_SEARCH_RESULTS", 20)
+
+    # Backends with their own full-text index (such as SQLite FTS5) rank directly
+    backend = util.get_backend()
+    if hasattr(backend, "search"):
+        titles = backend.search(query, limit)
+    else:
+        titles = [title for title, _ in get_index().rank(query, limit)]
+
+    results = []
+    for title in titles:
+        content = util.get_entry(title)
+        if content is not None:
+            results.append({"title": title, "snippet": snippet(content, query)})
+    return results
+
+
+@receiver(entries_saved)
+def update_index(sender, entries, **kwargs):
+    """ Keeps the search index in sync with saved entries. """
+    if not hasattr(util.get_backend(), "search"):
+        get_index().update(entries)
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by `util.save_entry` after entries are written to storage.
+# Receivers get `entries`, a dict mapping each saved title to its Markdown content.
+entries_saved = Signal()
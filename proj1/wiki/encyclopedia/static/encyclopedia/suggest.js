@@ -0,0 +1,30 @@
+// Suggests entry names in the searchbar as the user types
+document.addEventListener("DOMContentLoaded", () => {
+    const search = document.querySelector(".search")
+    const datalist = document.querySelector("#suggestions")
+    let latest = 0
+
+    search.addEventListener("input", () => {
+        const q = search.value.trim()
+        if (!q) {
+            datalist.innerHTML = ""
+            return
+        }
+
+        // Ignore responses that arrive after a newer keystroke's
+        const request = ++latest
+        fetch(`${search.dataset.suggestUrl}?q=${encodeURIComponent(q)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (request !== latest) {
+                return
+            }
+            datalist.innerHTML = ""
+            data.suggestions.forEach(title => {
+                const option = document.createElement("option")
+                option.value = title
+                datalist.append(option)
+            })
+        })
+    })
+})
@@ -0,0 +1,122 @@
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.dispatch import receiver
+
+from . import util
+from .signals import entries_saved
+
+# Trigrams shared by more titles than this are too common to narrow down typo matches
+COMMON_TRIGRAM_RATIO = 0.05
+COMMON_TRIGRAM_MINIMUM = 1000
+
+# Fraction of a query's trigrams a title must share to count as a typo match
+MIN_SIMILARITY = 0.3
+
+
+def trigrams(text):
+    """ Returns the set of trigrams of a case-folded, space-padded string. """
+    padded = f"  {text.casefold()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleSuggester:
+    """
+    Suggests entry titles for a partially typed query.
+    Prefix matches come from binary search over a sorted list of case-folded
+    titles; misspellings are caught by a trigram index over the titles.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.folded = []        # sorted (case-folded title, title) pairs
+        self.titles = []        # title ids -> title
+        self.ids = {}           # title -> title id
+        self.trigrams = {}      # trigram -> set of title ids
+
+    def _add(self, title):
+        if title in self.ids:
+            return
+        insort(self.folded, (title.casefold(), title))
+        self.ids[title] = len(self.titles)
+        self.titles.append(title)
+        for trigram in trigrams(title):
+            self.trigrams.setdefault(trigram, set()).add(self.ids[title])
+
+    def _rebuild(self, version):
+        self.folded = sorted((title.casefold(), title) for title in util.list_entries())
+        self.titles = [title for _, title in self.folded]
+        self.ids = {title: i for i, title in enumerate(self.titles)}
+        self.trigrams = {}
+        for i, title in enumerate(self.titles):
+            for trigram in trigrams(title):
+                self.trigrams.setdefault(trigram, set()).add(i)
+        self.version = version
+
+    def update(self, titles):
+        """
+        Adds newly saved titles without rebuilding the index. The index stays
+        current only if this save was the one change to the titles since it
+        was built; titles other processes wrote meanwhile are found by the
+        rebuild in the next `suggest`.
+        """
+        with self._lock:
+            if self.version is None:
+                return
+            for title in titles:
+                self._add(title)
+            # `save_entries` moved the title index version exactly once
+            if util.index_version() == self.version + 1:
+                self.version += 1
+
+    def suggest(self, query, limit):
+        """ Returns up to `limit` titles matching `query`, prefix matches first. """
+        query = query.strip()
+        if not query:
+            return []
+        with self._lock:
+            version = util.index_version()
+            if version != self.version:
+                self._rebuild(version)
+
+            # Titles starting with the query
+            folded = query.casefold()
+            results = []
+            i = bisect_left(self.folded, (folded,))
+            while i < len(self.folded) and len(results) < limit and self.folded[i][0].startswith(folded):
+                results.append(self.folded[i][1])
+                i += 1
+            if len(results) >= limit or len(folded) < 3:
+                return results
+
+            # Titles sharing enough trigrams with the query, to tolerate typos
+            query_trigrams = trigrams(query)
+            common = max(COMMON_TRIGRAM_MINIMUM, COMMON_TRIGRAM_RATIO * len(self.titles))
+            shared = Counter()
+            for trigram in query_trigrams:
+                ids = self.trigrams.get(trigram, ())
+                if len(ids) <= common:
+                    shared.update(ids)
+            found = set(results)
+            for i, count in shared.most_common(limit + len(results)):
+                if count < MIN_SIMILARITY * len(query_trigrams) or len(results) >= limit:
+                    break
+                if self.titles[i] not in found:
+                    results.append(self.titles[i])
+            return results
+
+
+_suggester = TitleSuggester()
+
+
+def suggest(query, limit=10):
+    """ Returns up to `limit` entry titles to suggest for a partially typed query. """
+    return _suggester.suggest(query, limit)
+
+
+@receiver(entries_saved)
+def update_suggestions(sender, entries, **kwargs):
+    """ Keeps title suggestions in sync with saved entries. """
+    _suggester.update(entries)
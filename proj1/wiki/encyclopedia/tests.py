@@ -1,3 +1,787 @@
-from django.test import TestCase
+import math
+import os
+import io
+import json
+import random
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+from contextlib import closing
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from . import benchmarks, links, search, suggest, util, warmup
+from .backends import FileSystemBackend, SQLiteBackend
+
+
+class WikiTestCase(SimpleTestCase):
+    """
+    Runs each test against an empty entries directory of its own,
+    with the process-wide indexes and caches starting cold.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.entries = os.path.join(self.root, "entries")
+        os.makedirs(self.entries)
+        settings = override_settings(
+            MEDIA_ROOT=self.root,
+            WIKI_ENTRY_BACKEND="encyclopedia.backends.FileSystemBackend",
+            WIKI_SEARCH_INDEX=os.path.join(self.root, "search.index"),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.reset()
+        self.addCleanup(self.reset)
+
+    def reset(self):
+        util._backend = None
+        util._index = util.EntryIndex()
+        util._renders = util.RenderCache()
+        search._search_index = None
+        suggest._suggester = suggest.TitleSuggester()
+        links._graph = links.LinkGraph()
+
+    def write(self, title, content, mtime=None, touch_directory=True):
+        """
+        Writes an entry file directly, as another process or an editor would.
+        Rewriting an existing file in place leaves the directory's mtime alone,
+        unless `touch_directory` bumps it as adding or removing a file does.
+        """
+        path = os.path.join(self.entries, f"{title}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        if touch_directory:
+            # Make sure the directory looks changed even within the clock's resolution
+            stat = os.stat(self.entries)
+            os.utime(self.entries, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+class EntryIndexTests(WikiTestCase):
+    """ Tests for the in-process index of entry titles. """
+
+    def test_saved_entries_are_listed_in_order(self):
+        util.save_entries([("Python", "# Python"), ("CSS", "# CSS")])
+        util.save_entry("Django", "# Django")
+        self.assertEqual(util.list_entries(), ["CSS", "Django", "Python"])
+        self.assertEqual(util.find_entry("django"), "Django")
+        self.assertIsNone(util.find_entry("Flask"))
+
+    def test_external_changes_are_picked_up(self):
+        util.save_entry("CSS", "# CSS")
+        version = util.index_version()
+        self.write("HTML", "# HTML")
+        self.assertEqual(util.list_entries(), ["CSS", "HTML"])
+        self.assertGreater(util.index_version(), version)
+        os.remove(os.path.join(self.entries, "CSS.md"))
+        self.write("Git", "# Git")
+        self.assertEqual(util.list_entries(), ["Git", "HTML"])
+
+    def test_entries_written_during_a_save_are_not_hidden(self):
+        util.list_entries()
+        backend = util.get_backend()
+        save_many = backend.save_many
+
+        # Another process writes an entry between this save and indexing it
+        def racing_save_many(entries):
+            save_many(entries)
+            self.write("Git", "# Git")
+
+        backend.save_many = racing_save_many
+        util.save_entry("CSS", "# CSS")
+        self.assertEqual(util.list_entries(), ["CSS", "Git"])
+
+    def test_saves_do_not_list_entries(self):
+        """ Batches of saves, as in an import, are only listed again once they are looked up. """
+        # The search index lists the entries once when it first loads
+        search.search("entry")
+        with mock.patch.object(util.get_backend(), "list", wraps=util.get_backend().list) as listing:
+            for batch in range(5):
+                util.save_entries([(f"Entry {batch} {i}", "# Entry") for i in range(10)])
+            self.assertEqual(listing.call_count, 0)
+            self.assertEqual(len(util.list_entries()), 50)
+            self.assertEqual(listing.call_count, 1)
+
+    def test_version_only_moves_when_titles_change(self):
+        util.save_entry("CSS", "# CSS")
+        version = util.index_version()
+        self.write("CSS", "# Cascading")
+        self.assertEqual(util.index_version(), version)
+        self.write("HTML", "# HTML")
+        self.assertGreater(util.index_version(), version)
+
+    def test_index_etag_follows_titles(self):
+        util.save_entry("CSS", "# CSS")
+        etag = util.index_etag()
+        self.assertEqual(util.index_etag(), etag)
+        util.save_entry("HTML", "# HTML")
+        self.assertNotEqual(util.index_etag(), etag)
+
+
+class RenderCacheTests(WikiTestCase):
+    """ Tests for the LRU cache of rendered entry HTML. """
+
+    def test_render_is_cached_until_the_entry_changes(self):
+        util.save_entry("CSS", "# CSS")
+        html = util.render_entry("CSS")
+        self.assertIn("<h1>CSS</h1>", html)
+        self.assertIs(util.render_entry("CSS"), html)
+
+        util.save_entry("CSS", "# Cascading Style Sheets")
+        self.assertIn("Cascading Style Sheets", util.render_entry("CSS"))
+
+    def test_external_edit_is_rendered(self):
+        self.write("CSS", "# CSS", mtime=1_000_000)
+        self.assertIn("<h1>CSS</h1>", util.render_entry("CSS"))
+        self.write("CSS", "# Edited", mtime=2_000_000)
+        self.assertIn("<h1>Edited</h1>", util.render_entry("CSS"))
+
+    def test_touched_entry_reuses_its_render(self):
+        self.write("CSS", "# CSS", mtime=1_000_000)
+        html = util.render_entry("CSS")
+        self.write("CSS", "# CSS", mtime=2_000_000)
+        self.assertIs(util.render_entry("CSS"), html)
+
+    def test_missing_entry_renders_none(self):
+        self.assertIsNone(util.render_entry("Missing"))
+
+    @override_settings(WIKI_RENDER_CACHE_SIZE=2)
+    def test_least_recently_used_render_is_evicted(self):
+        for title in ("A", "B", "C"):
+            util.save_entry(title, f"# {title}")
+        first = util.render_entry("A")
+        util.render_entry("B")
+        self.assertIs(util.render_entry("A"), first)
+        util.render_entry("C")
+        self.assertEqual(list(util._renders._renders), ["A", "C"])
+        self.assertIn("<h1>B</h1>", util.render_entry("B"))
+
+
+class SearchTests(WikiTestCase):
+    """ Tests for the BM25 full-text search index and its snapshot and journal. """
+
+    def index_path(self):
+        return os.path.join(self.root, "search.index")
+
+    def test_results_are_ranked_with_snippets(self):
+        util.save_entries([
+            ("Python", "# Python\n\nPython is a language. Django is written in Python."),
+            ("Django", "# Django\n\nA web framework written in Python."),
+            ("CSS", "# CSS\n\nStyles web pages."),
+        ])
+        results = search.search("python")
+        self.assertEqual([result["title"] for result in results], ["Python", "Django"])
+        self.assertIn("Python is a language", results[0]["snippet"])
+        self.assertEqual(search.search("nothing matches"), [])
+        self.assertEqual(len(search.search("web python", limit=1)), 1)
+
+    def test_early_stopping_ranks_like_scoring_every_entry(self):
+        rng = random.Random(0)
+        words = "alpha beta gamma delta web server cache index python django".split()
+        util.save_entries([
+            (f"Entry {i}", " ".join(rng.choices(words, k=rng.randint(5, 60)))) for i in range(300)
+        ])
+        index = search.get_index()
+        n = len(index.docs)
+        avg_length = index.total_length / n
+        for query in ("python", "python django", "alpha web cache", "gamma missing"):
+            scores = {}
+            for term in set(search.tokenize(query)) & index.postings.keys():
+                posting = index.postings[term]
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for title, tf in posting.items():
+                    length = index.docs[title][1]
+                    scores[title] = scores.get(title, 0) + idf * tf * (search.K1 + 1) / (
+                        tf + search.K1 * (1 - search.B + search.B * length / avg_length))
+            expected = sorted(scores.values(), reverse=True)[:10]
+            ranked = index.rank(query, 10)
+            self.assertEqual(len(ranked), len(expected))
+            for (title, score), best in zip(ranked, expected):
+                self.assertAlmostEqual(score, best)
+                self.assertAlmostEqual(score, scores[title])
+
+    def test_restart_replays_the_journal(self):
+        util.save_entry("CSS", "Styles web pages")
+        search.search("styles")
+        util.save_entry("HTML", "Structures web pages")
+        restarted = search.SearchIndex(self.index_path())
+        self.assertEqual({title for title, _ in restarted.rank("pages", 10)}, {"CSS", "HTML"})
+
+    def test_corrupt_snapshot_is_rebuilt(self):
+        util.save_entry("CSS", "Styles web pages")
+        search.search("styles")
+        for path in (self.index_path(), f"{self.index_path()}.journal"):
+            with open(path, "wb") as f:
+                f.write(b"\x80\x05 not a pickle")
+        restarted = search.SearchIndex(self.index_path())
+        self.assertEqual(restarted.rank("styles", 10)[0][0], "CSS")
+
+    def test_saves_by_other_processes_are_found(self):
+        util.save_entries([("CSS", "Styles web pages"), ("HTML", "Structures web pages")])
+        search.search("pages")
+        # A second process sharing the snapshot and journal, loaded before the saves
+        other = search.SearchIndex(self.index_path())
+        other.rank("pages", 10)
+        util.save_entries([("Zebra", "A striped animal"), ("CSS", "Cascading style sheets")])
+        self.assertEqual(other.rank("striped", 10)[0][0], "Zebra")
+        self.assertEqual(other.rank("cascading", 10)[0][0], "CSS")
+        self.assertEqual(other.rank("styles", 10), [])
+
+    def test_compaction_by_another_process_is_caught_up(self):
+        util.save_entry("CSS", "Styles web pages")
+        other = search.SearchIndex(self.index_path())
+        other.rank("pages", 10)
+        with mock.patch.object(search, "COMPACT_AFTER", 1):
+            util.save_entry("CSS", "Cascading style sheets")
+            util.save_entry("Zebra", "A striped animal")
+        self.assertEqual(other.rank("cascading", 10)[0][0], "CSS")
+        self.assertEqual(other.rank("striped", 10)[0][0], "Zebra")
+        leftovers = [name for name in os.listdir(self.root) if name.endswith(".tmp")]
+        self.assertEqual(leftovers, [])
+
+
+class BackendTests:
+    """ Tests every entry backend must pass, mixed into a test case per backend. """
+
+    def test_save_and_get(self):
+        self.backend.save("CSS", "# CSS")
+        self.backend.save_many([("HTML", "# HTML", None), ("CSS", "# Cascading", None)])
+        self.assertEqual(sorted(self.backend.list()), ["CSS", "HTML"])
+        self.assertEqual(self.backend.get("CSS"), "# Cascading")
+        self.assertIsNone(self.backend.get("Missing"))
+
+    def test_modified_time(self):
+        self.backend.save_many([("CSS", "# CSS", 1_000_000)])
+        self.assertEqual(self.backend.modified_time("CSS").timestamp(), 1_000_000)
+        with self.assertRaises(FileNotFoundError):
+            self.backend.modified_time("Missing")
+
+    def test_version_changes_with_new_entries(self):
+        self.backend.save("CSS", "# CSS")
+        version = self.backend.version()
+        self.backend.save("HTML", "# HTML")
+        self.assertNotEqual(self.backend.version(), version)
+
+    def test_unicode_content(self):
+        self.backend.save("Café", "Crème brûlée ☕")
+        self.assertEqual(self.backend.get("Café"), "Crème brûlée ☕")
+
+
+class FileSystemBackendTests(BackendTests, WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = FileSystemBackend()
+
+
+class SQLiteBackendTests(BackendTests, WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = SQLiteBackend(os.path.join(self.root, "entries.sqlite3"))
+        self.addCleanup(lambda: self.backend.connection().close())
+
+    def test_version_changes_with_edits(self):
+        self.backend.save("CSS", "# CSS")
+        version = self.backend.version()
+        self.backend.save("CSS", "# Cascading")
+        self.assertNotEqual(self.backend.version(), version)
+
+    def test_search(self):
+        self.backend.save_many([
+            ("Python", "Python is a language, Python runs Django", None),
+            ("Django", "A web framework written in Python", None),
+            ("CSS", "Styles web pages", None),
+        ])
+        self.assertEqual(self.backend.search("python", 10), ["Python", "Django"])
+        self.assertEqual(self.backend.search("!!", 10), [])
+
+    def test_wiki_uses_configured_backend(self):
+        with override_settings(WIKI_ENTRY_BACKEND="encyclopedia.backends.SQLiteBackend",
+                               WIKI_SQLITE_PATH=self.backend.path):
+            self.reset()
+            self.addCleanup(util.get_backend().connection().close)
+            util.save_entries([("CSS", "Styles web pages"), ("HTML", "Structures web pages")])
+            self.assertEqual(util.list_entries(), ["CSS", "HTML"])
+            self.assertEqual([result["title"] for result in search.search("styles")], ["CSS"])
+            self.reset()
+        self.assertEqual(os.listdir(self.entries), [])
+
+    def test_migrate_from_files(self):
+        self.write("CSS", "# CSS", mtime=1_000_000)
+        self.write("HTML", "# HTML")
+        out = StringIO()
+        call_command("wiki_migrate_sqlite", database=self.backend.path, stdout=out)
+        self.assertIn("Migrated 2 entries", out.getvalue())
+        self.assertEqual(sorted(self.backend.list()), ["CSS", "HTML"])
+        self.assertEqual(self.backend.modified_time("CSS").timestamp(), 1_000_000)
+
+
+class SaveTests(WikiTestCase):
+    """ Tests for atomic saves and the titles entries may be saved under. """
+
+    def files(self):
+        """ Returns every file under the test's root directory. """
+        return sorted(os.path.relpath(os.path.join(directory, name), self.root)
+                      for directory, _, names in os.walk(self.root) for name in names)
+
+    def test_save_leaves_no_temporary_files(self):
+        util.save_entries([("CSS", "# CSS"), ("HTML", "# HTML")])
+        util.save_entry("CSS", "# Cascading")
+        self.assertEqual(sorted(os.listdir(self.entries)), ["CSS.md", "HTML.md"])
+
+    def test_failed_save_leaves_no_temporary_files(self):
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                util.save_entries([("CSS", "# CSS"), ("HTML", "# HTML")])
+        self.assertEqual(os.listdir(self.entries), [])
+
+    def test_titles_outside_entries_are_rejected_before_writing(self):
+        backend = util.get_backend()
+        for title in ("../escape", "/../../tmp/escape", "a\\b", "..", ""):
+            with self.assertRaises(SuspiciousFileOperation):
+                backend.save_many([("Fine", "# Fine", None), (title, "# Bad", None)])
+        self.assertEqual(self.files(), [])
+
+    def test_create_rejects_path_titles(self):
+        title = "/../../../../../" + os.path.relpath(self.root, "/") + "/pw"
+        response = self.client.post(reverse("create"), {"title": title[-32:], "contents": "x"})
+        self.assertContains(response, "Titles cannot contain slashes")
+        response = self.client.post(reverse("create"), {"title": "../pw", "contents": "x"})
+        self.assertContains(response, "Titles cannot contain slashes")
+        self.assertEqual(self.files(), [])
+
+    def test_edit_rejects_path_titles(self):
+        response = self.client.post(reverse("edit", args=[".."]), {"contents": "x"})
+        self.assertContains(response, "Titles cannot contain slashes")
+        self.assertEqual(self.files(), [])
+
+    def test_create_and_edit(self):
+        response = self.client.post(reverse("create"), {"title": "CSS", "contents": "# CSS"})
+        self.assertRedirects(response, reverse("contents", args=["CSS"]), fetch_redirect_response=False)
+        self.client.post(reverse("edit", args=["CSS"]), {"contents": "# Cascading"})
+        self.assertEqual(util.get_entry("CSS"), "# Cascading")
+        response = self.client.post(reverse("create"), {"title": "css", "contents": "# Again"})
+        self.assertContains(response, "Entry already exists")
+
+
+class ImportExportTests(WikiTestCase):
+    """ Tests for the wiki_import and wiki_export commands. """
+
+    def test_jsonl_round_trip(self):
+        util.save_entries([("CSS", "# CSS"), ("Café", "# Crème")])
+        path = os.path.join(self.root, "wiki.jsonl")
+        call_command("wiki_export", path, stderr=StringIO())
+        shutil.rmtree(self.entries)
+        os.makedirs(self.entries)
+        self.reset()
+        out = StringIO()
+        call_command("wiki_import", path, stdout=out)
+        self.assertIn("Imported 2 entries", out.getvalue())
+        self.assertEqual(util.list_entries(), ["CSS", "Café"])
+        self.assertEqual(util.get_entry("Café"), "# Crème")
+
+    def test_invalid_titles_are_skipped(self):
+        path = os.path.join(self.root, "wiki.jsonl")
+        with open(path, "w") as f:
+            for title in ("CSS", "../../escape", "/tmp/escape", "..", 42, "HTML"):
+                f.write(json.dumps({"title": title, "content": "# Entry"}) + "\n")
+        out, err = StringIO(), StringIO()
+        call_command("wiki_import", path, stdout=out, stderr=err)
+        self.assertIn("Imported 2 entries", out.getvalue())
+        self.assertIn("skipped 4 with invalid titles", out.getvalue())
+        self.assertIn("'../../escape'", err.getvalue())
+        self.assertFalse([name for _, _, names in os.walk(self.root) for name in names if "escape" in name])
+        self.assertEqual(sorted(os.listdir(self.entries)), ["CSS.md", "HTML.md"])
+
+    def test_tar_import(self):
+        path = os.path.join(self.root, "wiki.tar")
+        with tarfile.open(path, "w") as tar:
+            for name in ("entries/CSS.md", "entries/...md", "README.txt"):
+                data = b"# Entry"
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        call_command("wiki_import", path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(util.list_entries(), ["CSS"])
+
+
+class ConditionalGetTests(WikiTestCase):
+    """ Tests that entry and index pages answer conditional GETs. """
+
+    def test_entry_page_etag(self):
+        util.save_entry("CSS", "# CSS")
+        url = reverse("contents", args=["CSS"])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        util.save_entry("CSS", "# Cascading")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Cascading")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_entry_page_last_modified(self):
+        self.write("CSS", "# CSS", mtime=1_000_000)
+        url = reverse("contents", args=["CSS"])
+        last_modified = self.client.get(url)["Last-Modified"]
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.write("CSS", "# Edited", mtime=2_000_000)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_new_backlink_changes_entry_etag(self):
+        util.save_entries([("CSS", "# CSS"), ("HTML", "# HTML")])
+        url = reverse("contents", args=["CSS"])
+        etag = self.client.get(url)["ETag"]
+        util.save_entry("HTML", "# HTML\n\nStyled with [CSS](/wiki/CSS)")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "HTML")
+
+    def test_index_etag(self):
+        util.save_entry("CSS", "# CSS")
+        url = reverse("index")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.write("HTML", "# HTML")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "HTML")
+
+    def test_missing_entry_has_no_etag(self):
+        response = self.client.get(reverse("contents", args=["Missing"]))
+        self.assertContains(response, "is not found")
+        self.assertFalse(response.has_header("ETag"))
+
+
+@override_settings(WIKI_INDEX_PAGE_SIZE=2)
+class PaginationTests(WikiTestCase):
+    """ Tests for the cursor-paginated index page. """
+
+    def setUp(self):
+        super().setUp()
+        util.save_entries([(title, f"# {title}") for title in ("CSS", "Django", "Git", "HTML", "Python")])
+
+    def page(self, **params):
+        response = self.client.get(reverse("index"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["entries"], response.context["previous"], response.context["next"]
+
+    def test_pages(self):
+        self.assertEqual(self.page(), (["CSS", "Django"], None, "Git"))
+        self.assertEqual(self.page(**{"from": "Git"}), (["Git", "HTML"], "Git", "Python"))
+        self.assertEqual(self.page(**{"from": "Python"}), (["Python"], "Python", None))
+        self.assertEqual(self.page(before="Python"), (["Git", "HTML"], "Git", "Python"))
+        self.assertEqual(self.page(before="Git"), (["CSS", "Django"], None, "Git"))
+
+    def test_letter_jump(self):
+        self.assertEqual(self.page(**{"from": "H"}), (["HTML", "Python"], "HTML", None))
+        self.assertEqual([has for letter, has in util.entry_letters() if letter in "CHZ"],
+                         [True, True, False])
+
+    def test_unknown_cursor(self):
+        self.assertEqual(self.page(**{"from": "Flask"}), (["Git", "HTML"], "Git", "Python"))
+        self.assertEqual(self.page(before="Flask"), (["CSS", "Django"], None, "Git"))
+        self.assertEqual(self.page(before=""), (["CSS", "Django"], None, "Git"))
+
+    def test_cursor_past_the_end(self):
+        # Lowercase names sort after every capitalized one
+        for cursor in ("zzz", "a", "~"):
+            entries, previous, following = self.page(**{"from": cursor})
+            self.assertEqual((entries, following), ([], None))
+            self.assertEqual(self.page(before=previous), (["HTML", "Python"], "HTML", None))
+
+    def test_lowercase_cursor(self):
+        util.save_entry("jQuery", "# jQuery")
+        self.assertEqual(self.page(**{"from": "a"}), (["jQuery"], "jQuery", None))
+        self.assertEqual(self.page(before="jQuery"), (["HTML", "Python"], "HTML", "jQuery"))
+
+    def test_empty_wiki(self):
+        shutil.rmtree(self.entries)
+        os.makedirs(self.entries)
+        self.reset()
+        self.assertEqual(self.page(**{"from": "zzz"}), ([], None, None))
+
+
+class RandomPageTests(WikiTestCase):
+    """ Tests for picking a random entry from the title index. """
+
+    def test_redirects_to_an_entry(self):
+        util.save_entries([("CSS", "# CSS"), ("HTML", "# HTML"), ("Git", "# Git")])
+        seen = set()
+        for _ in range(50):
+            response = self.client.get(reverse("random"))
+            self.assertEqual(response.status_code, 302)
+            seen.add(response.url)
+        self.assertEqual(seen, {reverse("contents", args=[title]) for title in ("CSS", "HTML", "Git")})
+
+    def test_picks_up_external_changes(self):
+        util.save_entry("CSS", "# CSS")
+        os.remove(os.path.join(self.entries, "CSS.md"))
+        self.write("HTML", "# HTML")
+        self.assertEqual({util.random_entry() for _ in range(10)}, {"HTML"})
+
+    def test_empty_wiki(self):
+        self.assertIsNone(util.random_entry())
+        self.assertContains(self.client.get(reverse("random")), "has no entries yet")
+
+
+class SuggestTests(WikiTestCase):
+    """ Tests for searchbar title suggestions. """
+
+    def setUp(self):
+        super().setUp()
+        util.save_entries([(title, f"# {title}") for title in
+                           ("Python", "PyPI", "Pygments", "CSS", "Django", "JavaScript")])
+
+    def test_prefix_matches_come_first_in_order(self):
+        # Sorted case-insensitively
+        self.assertEqual(suggest.suggest("py"), ["Pygments", "PyPI", "Python"])
+        self.assertEqual(suggest.suggest("PY", limit=2), ["Pygments", "PyPI"])
+
+    def test_typos_are_matched_by_trigrams(self):
+        self.assertEqual(suggest.suggest("Djnago"), ["Django"])
+        self.assertEqual(suggest.suggest("Pythn")[0], "Python")
+        # Too short to tell a typo from a different word
+        self.assertEqual(suggest.suggest("Dj"), ["Django"])
+        self.assertEqual(suggest.suggest("Dx"), [])
+
+    def test_blank_query(self):
+        self.assertEqual(suggest.suggest("  "), [])
+
+    def test_new_and_external_titles_are_suggested(self):
+        suggest.suggest("py")
+        util.save_entry("Pyramid", "# Pyramid")
+        self.write("PyTorch", "# PyTorch")
+        # Prefix matches, then titles sharing trigrams with the query
+        self.assertEqual(suggest.suggest("pyt")[:2], ["Python", "PyTorch"])
+        self.assertEqual(suggest.suggest("pyr")[0], "Pyramid")
+
+    def test_titles_written_before_a_save_are_not_hidden(self):
+        suggest.suggest("py")
+        self.write("Zebra", "# Zebra")
+        util.save_entry("Pyramid", "# Pyramid")
+        self.assertIn("Zebra", util.list_entries())
+        self.assertEqual(suggest.suggest("zeb"), ["Zebra"])
+        self.assertEqual(suggest.suggest("pyr")[0], "Pyramid")
+
+    def test_save_does_not_rebuild(self):
+        suggest.suggest("py")
+        with mock.patch.object(suggest._suggester, "_rebuild") as rebuild:
+            util.save_entry("Pyramid", "# Pyramid")
+            util.save_entry("Python", "# Python, edited")
+            self.assertEqual(suggest.suggest("pyr")[0], "Pyramid")
+        rebuild.assert_not_called()
+
+    def test_endpoint(self):
+        response = self.client.get(reverse("suggest"), {"q": "jav"})
+        self.assertEqual(response.json(), {"query": "jav", "suggestions": ["JavaScript"]})
+
+
+class BenchmarkTests(WikiTestCase):
+    """ Tests for the benchmark harness behind wiki_benchmark. """
+
+    def test_run(self):
+        results = benchmarks.run([30, 60], repeat=3)
+        self.assertEqual([corpus["size"] for corpus in results["corpora"]], [30, 60])
+        for corpus in results["corpora"]:
+            for name, stats in corpus["operations"].items():
+                self.assertEqual(stats["calls"], 3, name)
+                self.assertLessEqual(stats["p50_ms"], stats["max_ms"], name)
+        # The scratch corpora are gone and the wiki's own entries are untouched
+        self.reset()
+        self.assertEqual(util.list_entries(), [])
+
+    def test_corpus_is_reproducible(self):
+        self.assertEqual(list(benchmarks.generate_corpus(20, seed=1)),
+                         list(benchmarks.generate_corpus(20, seed=1)))
+
+
+class WarmupTests(WikiTestCase):
+    """ Tests for pre-rendering entries into the render cache. """
+
+    def setUp(self):
+        super().setUp()
+        util.save_entries([(title, f"# {title}") for title in ("CSS", "Django", "Git", "HTML")])
+        hits = warmup.HitCounter()
+        patcher = mock.patch.object(warmup, "_hits", hits)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cached(self):
+        return list(util._renders._renders)
+
+    def test_warm_fills_the_render_cache(self):
+        self.assertEqual(warmup.warm(titles=["CSS", "Missing", "Git"], workers=1)[0], 2)
+        self.assertEqual(sorted(self.cached()), ["CSS", "Git"])
+        # Cached renders are served without converting the Markdown again
+        with mock.patch.object(util, "markdown", side_effect=AssertionError):
+            self.assertIn("<h1>CSS</h1>", util.render_entry("CSS"))
+
+    def test_top_falls_back_to_the_first_entries(self):
+        warmup.warm(top=2, workers=1)
+        self.assertEqual(sorted(self.cached()), ["CSS", "Django"])
+
+    def test_top_renders_the_most_requested_entries(self):
+        with override_settings(WIKI_HITS_FILE=os.path.join(self.root, "hits.json")):
+            for title in ("HTML", "Git", "HTML"):
+                self.client.get(reverse("contents", args=[title]))
+            util._renders = util.RenderCache()
+            warmup.warm(top=2, workers=1)
+        self.assertEqual(sorted(self.cached()), ["Git", "HTML"])
+
+    def test_hits_are_flushed_to_the_file(self):
+        path = os.path.join(self.root, "hits.json")
+        with override_settings(WIKI_HITS_FILE=path), mock.patch.object(warmup, "HITS_FLUSH_EVERY", 3):
+            for title in ("CSS", "Git", "CSS", "Git"):
+                warmup.record_hit(title)
+            with open(path) as f:
+                self.assertEqual(json.load(f), {"CSS": 2, "Git": 1})
+            # A restarted process reads the flushed counts back
+            self.assertEqual(warmup.HitCounter().most_requested(1), ["CSS"])
+            self.assertEqual(warmup._hits.most_requested(2), ["CSS", "Git"])
+
+    def test_hits_are_not_counted_without_a_file(self):
+        warmup.record_hit("CSS")
+        self.assertEqual(warmup._hits.most_requested(1), [])
+
+    @override_settings(WIKI_WARMUP=3)
+    def test_warm_on_first_request(self):
+        with mock.patch.object(warmup.threading, "Thread") as thread:
+            warmup.warm_on_first_request(None)
+        thread.assert_called_once_with(target=warmup.warm, kwargs={"top": 3}, daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+
+class BuildTests(WikiTestCase):
+    """ Tests for the incremental static export of wiki_build. """
+
+    def build(self):
+        out = StringIO()
+        call_command("wiki_build", self.site, jobs=1, stdout=out)
+        return out.getvalue()
+
+    def setUp(self):
+        super().setUp()
+        self.site = os.path.join(self.root, "site")
+        util.save_entries([("CSS", "# CSS"), ("HTML", "# HTML")])
+
+    def test_only_changed_pages_are_written(self):
+        self.assertIn("3 pages written", self.build())
+        self.assertTrue(os.path.exists(os.path.join(self.site, "wiki", "CSS.html")))
+        self.assertIn("0 pages written", self.build())
+
+        self.write("CSS", "# Cascading")
+        self.assertIn("1 pages written", self.build())
+        with open(os.path.join(self.site, "wiki", "CSS.html"), encoding="utf-8") as f:
+            self.assertIn("Cascading", f.read())
+
+    def test_new_backlinks_and_removed_entries(self):
+        self.build()
+        # The new page, the page it links to and the index
+        util.save_entry("Git", "# Git\n\nSee [CSS](/wiki/CSS)")
+        self.assertIn("3 pages written", self.build())
+        with open(os.path.join(self.site, "wiki", "CSS.html"), encoding="utf-8") as f:
+            self.assertIn("Git", f.read())
+
+        os.remove(os.path.join(self.entries, "HTML.md"))
+        self.write("Git", "# Git")
+        self.assertIn("1 removed", self.build())
+        self.assertFalse(os.path.exists(os.path.join(self.site, "wiki", "HTML.html")))
+
+
+class LinkTests(WikiTestCase):
+    """ Tests for the link graph behind backlinks, orphans and dead links. """
+
+    def setUp(self):
+        super().setUp()
+        util.save_entries([
+            ("CSS", "# CSS\n\nStyles [HTML](/wiki/HTML)."),
+            ("HTML", "# HTML\n\nSee [CSS](/wiki/CSS) and [Web Server](/wiki/Web%20Server)."),
+            ("Git", "# Git"),
+        ])
+
+    def test_backlinks(self):
+        self.assertEqual(links.backlinks("CSS"), ["HTML"])
+        self.assertEqual(links.backlinks("Git"), [])
+        self.assertContains(self.client.get(reverse("contents", args=["CSS"])), 'href="/wiki/HTML"')
+
+    def test_saved_edits_update_backlinks(self):
+        links.backlinks("CSS")
+        util.save_entry("Git", "# Git\n\nTracks [CSS](/wiki/CSS).")
+        util.save_entry("HTML", "# HTML")
+        self.assertEqual(links.backlinks("CSS"), ["Git"])
+        self.assertIsNotNone(links.backlinks_changed("CSS"))
+
+    def test_edits_by_other_processes_update_backlinks(self):
+        etag = self.client.get(reverse("contents", args=["CSS"]))["ETag"]
+        # Another worker edits one entry and adds another, both linking to CSS
+        self.write("Git", "# Git\n\nTracks [CSS](/wiki/CSS).", mtime=2_000_000)
+        self.write("Zebra", "# Zebra\n\nStriped like [CSS](/wiki/CSS).")
+        self.assertEqual(links.backlinks("CSS"), ["Git", "HTML", "Zebra"])
+        response = self.client.get(reverse("contents", args=["CSS"]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(WIKI_LINKS_RESCAN_INTERVAL=0)
+    def test_edits_in_place_update_backlinks(self):
+        etag = self.client.get(reverse("contents", args=["CSS"]))["ETag"]
+        directory_mtime = os.stat(self.entries).st_mtime_ns
+        self.write("Git", "# Git\n\nTracks [CSS](/wiki/CSS).", mtime=2_000_000, touch_directory=False)
+        self.write("HTML", "# HTML", mtime=2_000_000, touch_directory=False)
+        self.assertEqual(os.stat(self.entries).st_mtime_ns, directory_mtime)
+        self.assertEqual(links.backlinks("CSS"), ["Git"])
+        response = self.client.get(reverse("contents", args=["CSS"]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'href="/wiki/Git"')
+
+    @override_settings(WIKI_LINKS_RESCAN_INTERVAL=60)
+    def test_edits_in_place_are_checked_every_interval(self):
+        links.backlinks("CSS")
+        self.write("Git", "# Git\n\nTracks [CSS](/wiki/CSS).", mtime=2_000_000, touch_directory=False)
+        now = links.time.monotonic()
+        with mock.patch.object(links.time, "monotonic", return_value=now + 30):
+            self.assertEqual(links.backlinks("CSS"), ["HTML"])
+        with mock.patch.object(links.time, "monotonic", return_value=now + 61):
+            self.assertEqual(links.backlinks("CSS"), ["Git", "HTML"])
+
+    @override_settings(WIKI_LINKS_RESCAN_INTERVAL=3600)
+    def test_sqlite_edits_update_backlinks(self):
+        path = os.path.join(self.root, "entries.sqlite3")
+        with override_settings(WIKI_ENTRY_BACKEND="encyclopedia.backends.SQLiteBackend",
+                               WIKI_SQLITE_PATH=path):
+            self.reset()
+            self.addCleanup(util.get_backend().connection().close)
+            util.save_entries([("CSS", "# CSS"), ("HTML", "# HTML\n\nSee [CSS](/wiki/CSS).")])
+            self.assertEqual(links.backlinks("CSS"), ["HTML"])
+            # Another process edits an entry without adding or removing any
+            with closing(sqlite3.connect(path)) as conn, conn:
+                conn.execute("UPDATE entries SET content = '# HTML', modified = modified + 1 "
+                             "WHERE title = 'HTML'")
+            self.assertEqual(links.backlinks("CSS"), [])
+            self.reset()
+
+    def test_orphans_and_dead_links(self):
+        out = StringIO()
+        call_command("wiki_links", stdout=out)
+        self.assertIn("Orphans (1):\n  Git", out.getvalue())
+        self.assertIn("HTML -> Web Server", out.getvalue())
+        self.assertEqual(links.dead_links(), {"HTML": ["Web Server"]})
+
+    def test_benchmark_reset_discards_the_graph(self):
+        graph = links._graph
+        links.backlinks("CSS")
+        benchmarks.reset_state()
+        self.assertIsNot(links._graph, graph)
+        self.assertFalse(links._graph.built)
@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path("", views.index, name="index"),
     path("search", views.search, name="search"),
+    path("suggest", views.suggest, name="suggest"),
     path("create", views.create, name="create"),
     path("edit/<str:title>", views.edit, name="edit"),
     path("random", views.random_page, name="random"),
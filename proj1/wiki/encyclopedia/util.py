@@ -1,16 +1,228 @@
-import re
+import hashlib
+import random
+import string
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
 
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from django.conf import settings
+from django.utils.module_loading import import_string
+from markdown2 import markdown
+
+from .signals import entries_saved
+
+
+class EntryIndex:
+    """
+    In-process index of the titles of all entries in the backend.
+    Titles are only re-listed when the backend's version (the `entries`
+    directory mtime for files) changes. `save_entries` adds the titles it
+    saved in place but keeps the version it last listed at, so the next
+    lookup lists the entries again once, picking up any titles another
+    process wrote meanwhile. Titles are also kept in a case-folded lookup
+    table for O(1) case-insensitive matches.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._backend_version = None
+        self.titles = []
+        self.folded = {}
+        self.version = 0
+        self._etag = None
+
+    def refresh(self):
+        """
+        Re-lists the entries if they changed since the last scan. The index
+        version only moves if the titles did, such as when the re-list after
+        a save finds no other process's titles.
+        """
+        backend_version = get_backend().version()
+        if backend_version is not None and backend_version == self._backend_version:
+            return
+        with self._lock:
+            if backend_version is not None and backend_version == self._backend_version:
+                return
+            titles = sorted(get_backend().list())
+            self._backend_version = backend_version
+            if titles == self.titles:
+                return
+            self.titles = titles
+            self.folded = {title.casefold(): title for title in self.titles}
+            self.version += 1
+
+    def add(self, titles):
+        """
+        Records titles that have just been written to storage.
+        The backend version is left as it was, so the next `refresh` lists
+        the entries again and picks up any other process's writes since.
+        """
+        with self._lock:
+            new = [title for title in titles if self.folded.get(title.casefold()) != title]
+            if len(new) == 1:
+                self.titles.insert(bisect_left(self.titles, new[0]), new[0])
+            elif new:
+                self.titles = sorted(self.titles + new)
+            for title in new:
+                self.folded[title.casefold()] = title
+            self.version += 1
+
+    def etag(self):
+        """ Returns a hash of the titles, cached per index version. """
+        with self._lock:
+            if self._etag is None or self._etag[0] != self.version:
+                digest = hashlib.sha256("\n".join(self.titles).encode("utf-8")).hexdigest()
+                self._etag = (self.version, digest)
+            return self._etag[1]
+
+    def find(self, title):
+        """ Returns the stored title matching `title` case-insensitively. """
+        self.refresh()
+        return self.folded.get(title.casefold())
+
+
+# Rendered HTML of an entry, along with the file mtime and content hash it came from
+Render = namedtuple("Render", ["mtime", "digest", "html"])
+
+
+class RenderCache:
+    """
+    Size-bounded LRU cache of rendered entry HTML, keyed by title.
+    Entries are validated against the file's mtime by `render_entry`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._renders = OrderedDict()
+
+    @property
+    def maxsize(self):
+        return getattr(settings, "WIKI_RENDER_CACHE_SIZE", 1024)
+
+    def get(self, title):
+        with self._lock:
+            render = self._renders.get(title)
+            if render is not None:
+                self._renders.move_to_end(title)
+            return render
+
+    def put(self, title, render):
+        with self._lock:
+            self._renders[title] = render
+            self._renders.move_to_end(title)
+            while len(self._renders) > self.maxsize:
+                self._renders.popitem(last=False)
+
+    def discard(self, title):
+        with self._lock:
+            self._renders.pop(title, None)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_index = EntryIndex()
+_renders = RenderCache()
+
+
+def get_backend():
+    """
+    Returns the entry storage backend named by `WIKI_ENTRY_BACKEND`,
+    by default one Markdown file per entry in `default_storage`.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            path = getattr(settings, "WIKI_ENTRY_BACKEND",
+                           "encyclopedia.backends.FileSystemBackend")
+            _backend = import_string(path)()
+        return _backend
+
+
+def valid_title(title):
+    """
+    Returns whether `title` can name an entry: it is not empty and has no
+    path separators or `..` that could address a file outside `entries/`.
+    """
+    return bool(title) and not any(part in title for part in ("/", "\\", "..", "\0"))
 
 
 def list_entries():
     """
     Returns a list of all names of encyclopedia entries.
     """
-    _, filenames = default_storage.listdir("entries")
-    return list(sorted(re.sub(r"\.md$", "", filename)
-                for filename in filenames if filename.endswith(".md")))
+    _index.refresh()
+    return list(_index.titles)
+
+
+def entries_page(start=None, before=None, size=100):
+    """
+    Returns a page of at most `size` entry names in sorted order, as a tuple
+    (names, previous, next). The page starts at the first name not less than
+    `start`, or ends just before the name `before` if that is given instead.
+    `previous` and `next` are the cursors for the neighbouring pages, passed
+    as `before` and `start` respectively, or None at either end.
+    """
+    _index.refresh()
+    titles = _index.titles
+    if before is not None:
+        end = bisect_left(titles, before)
+        begin = max(end - size, 0)
+        # Fill the first page rather than leave it short
+        end = max(end, min(size, len(titles)))
+    else:
+        begin = bisect_left(titles, start or "")
+        end = min(begin + size, len(titles))
+    page = titles[begin:end]
+    if begin == 0:
+        previous = None
+    elif begin < len(titles):
+        previous = titles[begin]
+    else:
+        # Past the last name the page is empty, and the one before it ends before the cursor
+        previous = start
+    following = titles[end] if end < len(titles) else None
+    return page, previous, following
+
+
+def entry_letters():
+    """
+    Returns the letters A-Z paired with whether any entry name starts with
+    that letter, using a binary search of the sorted names per letter.
+    """
+    _index.refresh()
+    titles = _index.titles
+    letters = []
+    for letter in string.ascii_uppercase:
+        i = bisect_left(titles, letter)
+        letters.append((letter, i < len(titles) and titles[i].startswith(letter)))
+    return letters
+
+
+def index_version():
+    """
+    Returns a counter that changes whenever the set of entry names changes,
+    for caches derived from `list_entries`.
+    """
+    _index.refresh()
+    return _index.version
+
+
+def find_entry(title):
+    """
+    Returns the name of the entry matching `title` regardless of case,
+    or None if there is no such entry.
+    """
+    return _index.find(title)
+
+
+def random_entry():
+    """
+    Returns the name of a random encyclopedia entry in constant time,
+    or None if there are no entries.
+    """
+    _index.refresh()
+    titles = _index.titles
+    return random.choice(titles) if titles else None
 
 
 def save_entry(title, content):
@@ -19,10 +231,21 @@ def save_entry(title, content):
     content. If an existing entry with the same title already exists,
     it is replaced.
     """
-    filename = f"entries/{title}.md"
-    if default_storage.exists(filename):
-        default_storage.delete(filename)
-    default_storage.save(filename, ContentFile(content))
+    save_entries([(title, content)])
+
+
+def save_entries(entries):
+    """
+    Saves many encyclopedia entries at once, given (title, content) pairs.
+    The backend writes them as one batch, and indexes and caches are
+    updated once for the whole batch rather than per entry.
+    """
+    entries = dict(entries)
+    get_backend().save_many([(title, content, None) for title, content in entries.items()])
+    _index.add(entries)
+    for title in entries:
+        _renders.discard(title)
+    entries_saved.send(sender=None, entries=entries)
 
 
 def get_entry(title):
@@ -30,8 +253,114 @@ def get_entry(title):
     Retrieves an encyclopedia entry by its title. If no such
     entry exists, the function returns None.
     """
+    return get_backend().get(title)
+
+
+def entry_modified_time(title):
+    """
+    Returns the time an encyclopedia entry was last modified.
+    Raises FileNotFoundError if no such entry exists.
+    """
+    return get_backend().modified_time(title)
+
+
+def _lookup(title, render):
+    """
+    Returns the cached `Render` of an entry, refreshing it if the entry
+    changed since it was cached, or None if no such entry exists.
+    The HTML is only rendered if `render` is True; otherwise a missing
+    render is left as None for `render_entry` to fill in later.
+    """
     try:
-        f = default_storage.open(f"entries/{title}.md")
-        return f.read().decode("utf-8")
+        mtime = entry_modified_time(title)
     except FileNotFoundError:
         return None
+    except NotImplementedError:
+        mtime = None
+
+    cached = _renders.get(title)
+    if cached is not None and mtime is not None and cached.mtime == mtime:
+        if cached.html is not None or not render:
+            return cached
+        content = get_entry(title)
+        if content is None:
+            return None
+        digest = cached.digest
+    else:
+        content = get_entry(title)
+        if content is None:
+            return None
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    # File was touched but its content is unchanged, so reuse the render
+    if cached is not None and cached.digest == digest:
+        html = cached.html
+    else:
+        html = None
+    if html is None and render:
+        html = markdown(content)
+    cached = Render(mtime, digest, html)
+    _renders.put(title, cached)
+    return cached
+
+
+def cache_render(title, mtime, digest, html):
+    """
+    Stores an entry rendered elsewhere (such as by the warm-up's process pool)
+    in the render cache, given the mtime and content hash it was rendered from.
+    """
+    _renders.put(title, Render(mtime, digest, html))
+
+
+def render_cache_size():
+    """ Returns the maximum number of rendered entries kept in the cache. """
+    return _renders.maxsize
+
+
+def render_entry(title):
+    """
+    Returns an encyclopedia entry converted from Markdown to HTML,
+    or None if no such entry exists. Renders are cached and reused
+    for as long as the entry's file is unchanged.
+    """
+    cached = _lookup(title, render=True)
+    return cached.html if cached is not None else None
+
+
+def entry_etag(title):
+    """
+    Returns a strong ETag for an entry, the SHA-256 of its content,
+    or None if no such entry exists. Reuses the hash cached alongside
+    the entry's render, so an unchanged entry is not read again.
+    """
+    cached = _lookup(title, render=False)
+    return cached.digest if cached is not None else None
+
+
+def entry_modified_times():
+    """
+    Returns a dict of each encyclopedia entry's name to the time it was
+    last modified, read in one pass by the backend.
+    """
+    return get_backend().modified_times()
+
+
+def entry_last_modified(title):
+    """
+    Returns the time an entry was last modified,
+    or None if no such entry exists or the backend cannot tell.
+    """
+    try:
+        return entry_modified_time(title)
+    except (FileNotFoundError, NotImplementedError):
+        return None
+
+
+def index_etag():
+    """
+    Returns an ETag for the list of entries. It is recomputed only when
+    the index version changes, and is a hash of the titles so that every
+    process serving the wiki agrees on it.
+    """
+    _index.refresh()
+    return _index.etag()
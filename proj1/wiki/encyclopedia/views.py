@@ -1,25 +1,57 @@
+from django.conf import settings
 from django.urls import reverse
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.views.decorators.http import condition
 
-import random
-from markdown2 import markdown
-
-from . import util
+from . import links, search as full_text, suggest as suggestions, util, warmup
 from .forms import NewPageForm, EditForm
 
 
+@condition(etag_func=lambda request: util.index_etag())
 def index(request):
-    """ Homepage for wiki app. Displays list of entries in wiki. """
+    """
+    Homepage for wiki app. Displays one page of the list of entries in wiki.
+    Pages are addressed by cursor: `?from=<name>` starts a page at that name
+    (or letter, to jump to it), and `?before=<name>` ends a page just before it.
+    """
+    entries, previous, following = util.entries_page(
+        start=request.GET.get("from"),
+        before=request.GET.get("before"),
+        size=getattr(settings, "WIKI_INDEX_PAGE_SIZE", 100)
+    )
     return render(request, "encyclopedia/index.html", {
-        "entries": util.list_entries()
+        "entries": entries,
+        "previous": previous,
+        "next": following,
+        "letters": util.entry_letters()
     })
 
 
+def contents_etag(request, title):
+    """ ETag of an entry page: the hash of its content and of the pages linking to it. """
+    digest = util.entry_etag(title)
+    if digest is None:
+        return None
+    return f"{digest}-{links.backlinks_etag(title)}"
+
+
+def contents_last_modified(request, title):
+    """ Last-Modified of an entry page: when its content or the pages linking to it changed. """
+    modified = util.entry_last_modified(title)
+    changed = links.backlinks_changed(title)
+    if modified is None or changed is None:
+        return modified
+    return max(modified, changed)
+
+
+@condition(etag_func=contents_etag, last_modified_func=contents_last_modified)
 def contents(request, title):
     """ Display the contents of an encyclopedia entry. """
-    contents = util.get_entry(title)
+    # Convert markdown to html (cached until the entry changes)
+    contents_html = util.render_entry(title)
     # Error if entry does not exist
-    if contents is None:
+    if contents_html is None:
         context = {
             "message": f"<b><i>{title}</i></b> is not found in encylopedia."
         }
@@ -27,13 +59,11 @@ def contents(request, title):
 
     # Load entry
     else:
-        contents = util.get_entry(title)
-        # Convert markdown to html
-        contents_html = markdown(contents)
-
+        warmup.record_hit(title)
         return render(request, "encyclopedia/contents.html", {
             "title": title,
-            "contents": contents_html
+            "contents": contents_html,
+            "backlinks": links.backlinks(title)
         })
 
 
@@ -42,7 +72,8 @@ def search(request):
     Process search query in searchbar.
     This view is only called from searchbar.
     If query matches name of entry, redirect to entry.
-    Otherwise display a list of results which contains the query as a substring.
+    Otherwise display a list of entries ranked by how well their contents match
+    the query, followed by entries whose name contains the query as a substring.
     Click on any entry name on results page to navigate to that entry's page.
     """
     # User submitted search query
@@ -51,17 +82,32 @@ def search(request):
         q = request.GET["q"]
 
         # If query matches name of entry, redirect to entry
-        if util.get_entry(q) is not None:
-            return contents(request, q)
+        match = util.find_entry(q)
+        if match is not None:
+            return contents(request, match)
+
+        # If no match, display ranked full-text results with a snippet of each entry
+        results = full_text.search(q)
 
-        # If no match, display a list of results which contains the query as a substring
-        results = [entry for entry in util.list_entries() if q.lower() in entry.lower()]
+        # Followed by any remaining entries which contain the query as a substring
+        found = {result["title"] for result in results}
+        results += [{"title": entry} for entry in util.list_entries()
+                    if q.lower() in entry.lower() and entry not in found]
         return render(request, "encyclopedia/search.html", {
             "query": q,
             "results": results
         })
 
 
+def suggest(request):
+    """
+    API route for searchbar autocomplete.
+    Returns JSON list of entry names that start with, or closely resemble, query `q`.
+    """
+    q = request.GET.get("q", "")
+    return JsonResponse({"query": q, "suggestions": suggestions.suggest(q)})
+
+
 def create(request):
     """ Create a new page in wiki. """
     # User submitted form data
@@ -73,10 +119,9 @@ def create(request):
         if form.is_valid():
             title = form.cleaned_data["title"]
             contents = form.cleaned_data["contents"]
-            entries = util.list_entries()
             
             # Error if title already exists
-            if title.lower() in [entry.lower() for entry in entries]:
+            if util.find_entry(title) is not None:
                 context = {
                     "message": f"Entry already exists with title: <a href={title.lower()}>{title}</a>"
                 }
@@ -104,6 +149,12 @@ def edit(request, title):
     Form to edit page contains a single textarea that is populated 
     with existing markdown content.
     """
+    # Titles that could address files outside of the entries directory
+    if not util.valid_title(title):
+        return render(request, "encyclopedia/error.html", {
+            "message": "Titles cannot contain slashes or \"..\"."
+        })
+
     # User submitted form
     if request.method == "POST":
         # Populate form
@@ -132,6 +183,11 @@ def edit(request, title):
 
 def random_page(request):
     """ Redirects to a random page in encyclopedia. """
-    entries = util.list_entries()
-    page = random.choice(entries)
+    page = util.random_entry()
+    # Error if there are no pages to choose from
+    if page is None:
+        context = {
+            "message": f"Encyclopedia has no entries yet. <a href={reverse('create')}>Create one</a>."
+        }
+        return render(request, "encyclopedia/error.html", context)
     return redirect("contents", title=page)
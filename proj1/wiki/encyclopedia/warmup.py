@@ -0,0 +1,139 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.signals import request_started
+from markdown2 import markdown
+
+from . import util
+
+# Number of page views counted before they are merged into `WIKI_HITS_FILE`
+HITS_FLUSH_EVERY = 1000
+
+
+class HitCounter:
+    """
+    Counts entry page views so the warm-up can pre-render the most requested
+    entries. Counts are merged into the JSON file `WIKI_HITS_FILE`, if set,
+    every `HITS_FLUSH_EVERY` views so they survive restarts.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.pending = Counter()
+        self.unflushed = 0
+
+    @property
+    def path(self):
+        return getattr(settings, "WIKI_HITS_FILE", None)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return Counter(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return Counter()
+
+    def record(self, title):
+        if self.path is None:
+            return
+        with self._lock:
+            self.pending[title] += 1
+            self.unflushed += 1
+            if self.unflushed >= HITS_FLUSH_EVERY:
+                self.flush()
+
+    def flush(self):
+        """ Merges the pending counts into the hits file. """
+        with self._lock:
+            counts = self._read()
+            counts.update(self.pending)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(counts, f)
+            os.replace(tmp, self.path)
+            self.pending.clear()
+            self.unflushed = 0
+
+    def most_requested(self, n):
+        """ Returns the titles of the `n` most viewed entries. """
+        if self.path is None:
+            return []
+        with self._lock:
+            counts = self._read()
+            counts.update(self.pending)
+        return [title for title, _ in counts.most_common(n)]
+
+
+_hits = HitCounter()
+
+
+def record_hit(title):
+    """ Counts a view of an entry page. """
+    _hits.record(title)
+
+
+def warm(titles=None, top=None, workers=None):
+    """
+    Pre-renders entries in a process pool and fills this process's render
+    cache with them. Renders the given `titles`, else the `top` most requested
+    entries (the first `top` entries if no views were counted, such as without
+    `WIKI_HITS_FILE`), else as many entries as the cache holds. Returns the
+    number of entries rendered and the seconds it took.
+    """
+    start = time.perf_counter()
+    if titles is None:
+        if top is not None:
+            titles = _hits.most_requested(top) or util.list_entries()[:top]
+        else:
+            titles = util.list_entries()
+    titles = titles[:util.render_cache_size()]
+
+    # Read in this process, only the Markdown conversion is worth shipping to workers
+    sources = []
+    for title in titles:
+        try:
+            mtime = util.entry_modified_time(title)
+        except FileNotFoundError:
+            continue
+        except NotImplementedError:
+            mtime = None
+        content = util.get_entry(title)
+        if content is not None:
+            sources.append((title, mtime, content))
+
+    if workers is None:
+        workers = getattr(settings, "WIKI_WARMUP_WORKERS", None) or os.cpu_count()
+    # The warm-up runs in a thread of the server, which is unsafe to fork
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as pool:
+        chunksize = max(1, len(sources) // (4 * workers))
+        htmls = pool.map(markdown, [content for _, _, content in sources], chunksize=chunksize)
+        for (title, mtime, content), html in zip(sources, htmls):
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            util.cache_render(title, mtime, digest, html)
+    return len(sources), time.perf_counter() - start
+
+
+def warm_on_first_request(sender, **kwargs):
+    """
+    Starts the warm-up configured by `WIKI_WARMUP` in the background when the
+    server handles its first request: True renders as many entries as the
+    cache holds, a number N renders the N most requested entries.
+    Each server process warms its own render cache.
+    """
+    request_started.disconnect(warm_on_first_request)
+    setting = getattr(settings, "WIKI_WARMUP", False)
+    if setting is False or setting is None:
+        return
+    top = None if setting is True else int(setting)
+    threading.Thread(target=warm, kwargs={"top": top}, daemon=True).start()
+
+
+request_started.connect(warm_on_first_request)
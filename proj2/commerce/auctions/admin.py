@@ -1,9 +1,12 @@
 from django.contrib import admin
 
-from .models import User, Listing, Bid, Comment
+from .models import User, Listing, Bid, BidSummary, ArchivedBid, Comment, Notification
 
 # Register your models here.
 admin.site.register(User)
 admin.site.register(Listing)
 admin.site.register(Bid)
+admin.site.register(BidSummary)
+admin.site.register(ArchivedBid)
 admin.site.register(Comment)
+admin.site.register(Notification)
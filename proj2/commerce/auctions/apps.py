@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        # Connect the receivers that invalidate cached listing fragments
+        from . import caching
+        from .search import create_index
+
+        # Create the full-text index of listings, kept in sync by database triggers
+        post_migrate.connect(create_index, sender=self)
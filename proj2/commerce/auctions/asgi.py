@@ -0,0 +1,68 @@
+"""
+Server-sent event stream of live updates for a listing page,
+served directly over ASGI alongside the Django application.
+"""
+import asyncio
+import re
+
+from django.conf import settings
+
+from .events import get_broker, listing_channel
+
+EVENTS_PATH = re.compile(r"^/listing/(\d+)/events$")
+
+
+async def listing_events(scope, receive, send, listing_id):
+    """
+    Streams the events published for a listing until the client disconnects,
+    with a comment every `AUCTIONS_EVENTS_KEEPALIVE` seconds to keep proxies
+    from closing an idle connection.
+    """
+    keepalive = getattr(settings, "AUCTIONS_EVENTS_KEEPALIVE", 15)
+    subscription = get_broker().subscribe(listing_channel(listing_id))
+    disconnect = asyncio.ensure_future(receive())
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+
+        message = asyncio.ensure_future(subscription.get())
+        while True:
+            done, _ = await asyncio.wait(
+                {message, disconnect}, timeout=keepalive, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                if disconnect.result()["type"] == "http.disconnect":
+                    message.cancel()
+                    break
+                # Ignore any request body and keep waiting for the disconnect
+                disconnect = asyncio.ensure_future(receive())
+            elif message in done:
+                await send({"type": "http.response.body", "body": message.result(), "more_body": True})
+                message = asyncio.ensure_future(subscription.get())
+            else:
+                await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+    finally:
+        subscription.close()
+        disconnect.cancel()
+
+
+def router(application):
+    """
+    Wraps the Django ASGI `application`, serving `/listing/<id>/events`
+    streams itself and passing every other request through.
+    """
+    async def app(scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            match = EVENTS_PATH.match(scope["path"])
+            if match:
+                return await listing_events(scope, receive, send, int(match.group(1)))
+        return await application(scope, receive, send)
+    return app
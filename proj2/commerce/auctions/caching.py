@@ -0,0 +1,39 @@
+"""
+Template fragment caching of listing pages.
+
+Fragments are keyed on the listing's `cache_version`, which is bumped in
+the database whenever a bid or comment is saved or deleted and when the
+listing closes. A stale fragment is therefore never looked up again, with
+any cache backend and however many processes serve the site.
+The cache is the alias named by `AUCTIONS_CACHE` (Django's local-memory
+`default` cache unless `CACHES` says otherwise), and fragments expire
+after `AUCTIONS_CACHE_TIMEOUT` seconds.
+"""
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Bid, Comment, Listing
+
+
+def fragment_cache():
+    """ Returns the template context used by the listing page's `{% cache %}` tags. """
+    return {
+        "cache_alias": getattr(settings, "AUCTIONS_CACHE", "default"),
+        "cache_timeout": getattr(settings, "AUCTIONS_CACHE_TIMEOUT", 3600),
+    }
+
+
+def bump_version(listing_ids):
+    """ Invalidates the cached fragments of the given listings. """
+    Listing.objects.filter(id__in=listing_ids).update(cache_version=F("cache_version") + 1)
+
+
+@receiver(post_save, sender=Bid)
+@receiver(post_delete, sender=Bid)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_listing(sender, instance, **kwargs):
+    """ Keeps fragments showing bids and comments in sync with them. """
+    bump_version([instance.listing_id])
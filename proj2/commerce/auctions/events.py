@@ -0,0 +1,113 @@
+"""
+Publish/subscribe of live listing events, such as new bids and closures.
+
+Events are published to a channel per listing and pushed to browsers as
+server-sent events by `auctions.asgi`. The broker is set by
+`AUCTIONS_EVENT_BROKER`, by default `InProcessBroker`, which only reaches
+subscribers in the same process. Another broker (such as one backed by
+Redis) only has to provide `subscribe(channel)` and `publish(channel, message)`.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """ A subscriber's queue of messages published to one channel. """
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    async def get(self):
+        """ Waits for the next message. """
+        return await self.queue.get()
+
+    def put(self, message):
+        # Publishers may run in any thread, so hand the message to the subscriber's loop
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Delivers messages to the subscribers of a channel in this process.
+    A subscription is just an asyncio queue, so idle subscribers cost a
+    few hundred bytes each and no thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channel):
+        """ Subscribes to `channel`. Must be called from a running event loop. """
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+    def publish(self, channel, message):
+        """ Sends `message` to every current subscriber of `channel`. """
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """ Returns the process-wide broker named by `AUCTIONS_EVENT_BROKER`. """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            path = getattr(settings, "AUCTIONS_EVENT_BROKER", "auctions.events.InProcessBroker")
+            _broker = import_string(path)()
+        return _broker
+
+
+def listing_channel(listing_id):
+    return f"listing-{listing_id}"
+
+
+def encode(event, data):
+    """ Formats an event as a server-sent event, encoded once for every subscriber. """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def publish_on_commit(listing_ids, event, data):
+    """
+    Publishes `event` to the viewers of each listing once the current
+    transaction commits, so a rolled back bid or closure is never announced.
+    """
+    message = encode(event, data)
+
+    def publish():
+        broker = get_broker()
+        for listing_id in listing_ids:
+            broker.publish(listing_channel(listing_id), message)
+
+    transaction.on_commit(publish)
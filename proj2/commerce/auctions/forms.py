@@ -1,5 +1,6 @@
 from django import forms
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 from .models import Bid, Listing, Comment
 
@@ -8,10 +9,18 @@ class CreateListingForm(forms.ModelForm):
     """
     Form for user to create a new listing.
     Data stored in `Listing` model.
+    Listings with an end time are closed automatically once it passes.
     """
+    end_time = forms.DateTimeField(
+        required=False,
+        input_formats=["%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S"],
+        widget=forms.DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
+        help_text="(optional) When bidding ends and the listing closes",
+    )
+
     class Meta:
         model = Listing
-        fields = ["title", "description", "starting_bid", "image_url", "category"]
+        fields = ["title", "description", "starting_bid", "image_url", "category", "end_time"]
         widgets = {
             "starting_bid": forms.NumberInput(attrs={'step': 0.50}),
         }
@@ -25,6 +34,12 @@ class CreateListingForm(forms.ModelForm):
             "category": "Select the category of your listing."
         }
 
+    def clean_end_time(self):
+        end_time = self.cleaned_data["end_time"]
+        if end_time is not None and end_time <= timezone.now():
+            raise forms.ValidationError("The end time must be in the future.")
+        return end_time
+
 
 class NewBidForm(forms.ModelForm):
     """
@@ -55,3 +70,14 @@ class NewCommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ["comment"]
+
+
+class SearchForm(forms.Form):
+    """
+    Form for searching open listings by text, category and price range.
+    Submitted by GET, so every field is optional.
+    """
+    q = forms.CharField(required=False, max_length=100, label="Search")
+    category = forms.ChoiceField(required=False, choices=[("", "All categories")] + Listing.CATEGORY_CHOICES)
+    min_price = forms.DecimalField(required=False, min_value=0, decimal_places=2, label="Min price")
+    max_price = forms.DecimalField(required=False, min_value=0, decimal_places=2, label="Max price")
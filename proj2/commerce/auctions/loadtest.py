@@ -0,0 +1,277 @@
+"""
+Load generator for the auctions app.
+
+Simulates signed in users concurrently browsing the index, viewing
+listings, bidding, commenting and toggling their watchlist, each in its
+own thread. Requests go through the Django test client in this process
+(which also counts database queries per request), or over HTTP to a
+running server (`runserver` or an ASGI server) sharing this database.
+Afterwards the listings are checked for integrity violations, such as a
+current price lower than their highest bid.
+"""
+import http.cookiejar
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from .models import Bid, Listing, User
+
+# Relative weights of each action in the default mix
+MIX = {"index": 40, "listing": 30, "bid": 15, "comment": 5, "watchlist": 10}
+
+PASSWORD = "loadtest"
+MAX_PRICE = Decimal("999.99")
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """ Leaves redirects unfollowed, like the test client, so each request is timed alone. """
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """ Minimal stand-in for the test client that talks to a live server with cookies and CSRF. """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect
+        )
+
+    def request(self, path, data=None):
+        url = self.base_url + path
+        headers = {}
+        if data is not None:
+            token = next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+            data = urllib.parse.urlencode({**data, "csrfmiddlewaretoken": token}).encode()
+            headers = {"X-CSRFToken": token, "Referer": url}
+        try:
+            with self.opener.open(urllib.request.Request(url, data, headers)) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def get(self, path, params=None):
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params)}"
+        return self.request(path)
+
+    def post(self, path, data):
+        return self.request(path, data)
+
+
+class TestClient:
+    """ Wraps the Django test client to return status codes like `HTTPClient`. """
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+
+    def get(self, path, params=None):
+        return self.client.get(path, params or {}).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data).status_code
+
+
+def create_data(users, listings, seed=0):
+    """
+    Creates the load test's seller, `users` bidders and `listings` open listings.
+    Returns the seller, the bidders and the listing ids.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(
+        [User(username="loadtest_seller", password=password)]
+        + [User(username=f"loadtest_user{i}", password=password) for i in range(users)]
+    )
+    seller = User.objects.get(username="loadtest_seller")
+    categories = [value for value, _ in Listing.CATEGORY_CHOICES]
+    Listing.objects.bulk_create([
+        Listing(
+            creator=seller, title=f"Load test listing {i}", description="Generated by loadtest",
+            starting_bid=Decimal("1.00"), current_price=Decimal("1.00"), category=rng.choice(categories),
+        )
+        for i in range(listings)
+    ])
+    bidders = list(User.objects.filter(username__startswith="loadtest_user").order_by("id"))
+    return seller, bidders, list(Listing.objects.filter(creator=seller).values_list("id", flat=True))
+
+
+def clean_up():
+    """ Deletes everything `create_data` created, with the bids and comments made on it. """
+    Listing.objects.filter(creator__username="loadtest_seller").delete()
+    User.objects.filter(username__startswith="loadtest_").delete()
+
+
+def check_integrity(seller):
+    """
+    Checks the seller's listings against their bids, returning the number
+    of listings breaking each rule.
+    """
+    bids = Bid.objects.filter(listing=OuterRef("pk")).order_by().values("listing")
+    listings = Listing.objects.filter(creator=seller).annotate(
+        max_bid=Subquery(bids.annotate(highest=Max("price")).values("highest")),
+        bids_made=Coalesce(Subquery(bids.annotate(count=Count("id")).values("count")), 0),
+        top_bidder=Subquery(
+            Bid.objects.filter(listing=OuterRef("pk")).order_by("-price", "-id").values("bidder")[:1]
+        ),
+    )
+    return {
+        "current_price below highest bid": listings.filter(current_price__lt=F("max_bid")).count(),
+        "highest_bid differs from highest bid": listings.filter(max_bid__isnull=False).exclude(
+            highest_bid=F("max_bid")).count(),
+        "bid_count differs from bids": listings.exclude(bid_count=F("bids_made")).count(),
+        "current bidder did not place highest bid": listings.filter(
+            is_closed=False, max_bid__isnull=False
+        ).filter(Q(current_bidder__isnull=True) | ~Q(current_bidder=F("top_bidder"))).count(),
+    }
+
+
+def percentile(samples, p):
+    """ Returns the `p`th percentile of sorted `samples`. """
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def run(users=8, requests=100, listings=50, url=None, mix=None, seed=0, keep=False, log=None):
+    """
+    Runs `requests` actions for each of `users` concurrent users against
+    `listings` fresh listings, over HTTP to `url` or through the test client,
+    and returns a JSON-serializable report.
+    """
+    mix = mix or MIX
+    actions, weights = list(mix), list(mix.values())
+    clean_up()
+    seller, bidders, listing_ids = create_data(users, listings, seed)
+    samples = {action: [] for action in actions}
+    lock = threading.Lock()
+
+    # Sign every user in before the clock starts
+    clients = []
+    for bidder in bidders:
+        if url is None:
+            client = TestClient()
+            client.client.force_login(bidder)
+        else:
+            client = HTTPClient(url)
+            client.get(reverse("login"))
+            client.post(reverse("login"), {"username": bidder.username, "password": PASSWORD})
+        clients.append(client)
+
+    def user(i):
+        rng = random.Random(seed * 1000 + i)
+        bidder, client = bidders[i], clients[i]
+        watching = set()
+        records = []
+        try:
+            for _ in range(requests):
+                action = rng.choices(actions, weights)[0]
+                listing_id = rng.choice(listing_ids)
+                if action == "index":
+                    call = lambda: client.get(reverse("index"))
+                elif action == "listing":
+                    call = lambda: client.get(reverse("listing", args=[listing_id]))
+                elif action == "bid":
+                    # Bid a little over the price this user last saw, read outside the timing
+                    seen = Listing.objects.values_list("current_price", flat=True).get(pk=listing_id)
+                    price = min(seen + Decimal(rng.randint(1, 100)) / 100, MAX_PRICE)
+                    call = lambda: client.post(reverse("listing", args=[listing_id]), {
+                        "bidder": bidder.id, "listing": listing_id, "price": price,
+                    })
+                elif action == "comment":
+                    call = lambda: client.post(reverse("comment", args=[listing_id]), {
+                        "comment": f"Comment from {bidder.username}",
+                    })
+                else:
+                    toggle = "remove" if listing_id in watching else "add"
+                    watching ^= {listing_id}
+                    call = lambda: client.post(reverse("watchlist"), {
+                        "listing_id": listing_id, "watchlist": toggle,
+                    })
+
+                # The log only holds `queries_limit` queries, after which a capture counts nothing
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    status = call()
+                    elapsed = (time.perf_counter() - start) * 1000
+                records.append((action, elapsed, status, len(queries) if url is None else None))
+        finally:
+            connection.close()
+            with lock:
+                for action, elapsed, status, queries in records:
+                    samples[action].append((elapsed, status, queries))
+
+    # The test client needs the test environment (for the `testserver` host),
+    # unless it is already set up by the test runner
+    own_environment = url is None
+    if own_environment:
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            own_environment = False
+    try:
+        threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+    finally:
+        if own_environment:
+            teardown_test_environment()
+
+    views = {}
+    for action, records in samples.items():
+        if not records:
+            continue
+        timings = sorted(elapsed for elapsed, _, _ in records)
+        queries = [count for _, _, count in records if count is not None]
+        views[action] = {
+            "requests": len(records),
+            "errors": sum(1 for _, status, _ in records if status >= 400),
+            "mean_ms": statistics.mean(timings),
+            "p50_ms": percentile(timings, 50),
+            "p95_ms": percentile(timings, 95),
+            "p99_ms": percentile(timings, 99),
+            "mean_queries": statistics.mean(queries) if queries else None,
+            "max_queries": max(queries) if queries else None,
+        }
+        if log is not None:
+            stats = views[action]
+            log(f"{action:<10} {stats['requests']:>6} requests  {stats['errors']:>4} errors  "
+                f"p50 {stats['p50_ms']:7.1f}ms  p95 {stats['p95_ms']:7.1f}ms  p99 {stats['p99_ms']:7.1f}ms"
+                + (f"  queries {stats['mean_queries']:5.1f} (max {stats['max_queries']})"
+                   if queries else ""))
+
+    total = sum(stats["requests"] for stats in views.values())
+    report = {
+        "mode": "test client" if url is None else url,
+        "users": users,
+        "listings": listings,
+        "requests": total,
+        "duration_s": duration,
+        "throughput_rps": total / duration,
+        "views": views,
+        "integrity": check_integrity(seller),
+        "bids_accepted": Bid.objects.filter(listing__creator=seller).count(),
+    }
+    if not keep:
+        clean_up()
+    return report
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from auctions.models import Bid, Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every listing's bid count, highest bid and last bid time from its bids "
+        "in a single UPDATE. Only needed once for listings bid on before the statistics were kept."
+    )
+
+    def handle(self, *args, **options):
+        bids = Bid.objects.filter(listing=OuterRef("pk")).order_by().values("listing")
+        # Compacted listings no longer have their bids, but kept their statistics
+        updated = Listing.objects.filter(bids_compacted=False).update(
+            bid_count=Coalesce(Subquery(bids.annotate(count=Count("id")).values("count")), 0),
+            highest_bid=Subquery(bids.annotate(highest=Max("price")).values("highest")),
+            last_bid_at=Subquery(bids.annotate(last=Max("created")).values("last")),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Updated bid statistics of {updated} listings."))
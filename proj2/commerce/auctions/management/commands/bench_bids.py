@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Max
+
+from auctions.models import User, Listing, Bid
+
+MAX_PRICE = Decimal("999.99")
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammers a single listing with concurrent bidders and reports bids per second "
+        "and lost updates (accepted bids that the listing's price no longer reflects). "
+        "Creates its own users and listing, and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bidders", type=int, default=8, help="Number of concurrent bidders")
+        parser.add_argument("--bids", type=int, default=200, help="Bids placed by each bidder")
+        parser.add_argument("--legacy", action="store_true",
+                            help="Use the old read, validate, save sequence to compare lost updates")
+
+    def handle(self, *args, **options):
+        creator = User.objects.create_user("bench_creator")
+        bidders = [User.objects.create_user(f"bench_bidder{i}") for i in range(options["bidders"])]
+        listing = Listing.objects.create(
+            creator=creator, title="Benchmark listing", description="Bid on me",
+            starting_bid=Decimal("1.00"), current_price=Decimal("1.00"), category="others"
+        )
+
+        accepted = [[] for _ in bidders]
+        rejected = [0] * len(bidders)
+        errors = [0] * len(bidders)
+
+        def bid(worker):
+            bidder = bidders[worker]
+            rng = random.Random(worker)
+            try:
+                for _ in range(options["bids"]):
+                    # Bid a little over the price this bidder last saw
+                    seen = Listing.objects.get(pk=listing.pk)
+                    price = min(seen.current_price + Decimal(rng.randint(1, 10)) / 100, MAX_PRICE)
+                    try:
+                        if options["legacy"]:
+                            placed = self.legacy_bid(seen, bidder, price)
+                        else:
+                            placed = seen.place_bid(bidder, price)
+                    except OperationalError:
+                        errors[worker] += 1
+                        continue
+                    if placed is not None:
+                        accepted[worker].append(price)
+                    else:
+                        rejected[worker] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bid, args=(i,)) for i in range(len(bidders))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        # Every accepted bid must be at most the final price, which must be the highest bid
+        listing.refresh_from_db()
+        highest = Bid.objects.filter(listing=listing).aggregate(Max("price"))["price__max"]
+        prices = [price for prices in accepted for price in prices]
+        lost = sum(1 for price in prices if price > listing.current_price)
+        if highest is not None and highest != listing.current_price:
+            lost += 1
+
+        attempts = len(prices) + sum(rejected) + sum(errors)
+        self.stdout.write(f"bids attempted:  {attempts} ({attempts / elapsed:.0f}/s)")
+        self.stdout.write(f"bids accepted:   {len(prices)} ({len(prices) / elapsed:.0f}/s)")
+        self.stdout.write(f"bids rejected:   {sum(rejected)} (outbid before saving)")
+        self.stdout.write(f"database errors: {sum(errors)}")
+        self.stdout.write(f"final price:     {listing.current_price} (highest bid {highest})")
+        if lost:
+            self.stdout.write(self.style.ERROR(f"lost updates:    {lost}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("lost updates:    0"))
+
+        listing.delete()
+        User.objects.filter(pk__in=[creator.pk] + [bidder.pk for bidder in bidders]).delete()
+
+    def legacy_bid(self, listing, bidder, price):
+        """ The read-modify-write sequence `views.listing` used before `Listing.place_bid`. """
+        if price < listing.current_price:
+            return None
+        bid = Bid.objects.create(bidder=bidder, listing=listing, price=price)
+        if bid.price > listing.current_price:
+            listing.current_price = bid.price
+            listing.current_bidder = bidder
+            listing.save()
+        return bid
@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from auctions.models import User, Listing
+from auctions.search import has_search_index, search_listings
+from auctions.views import keyset_page
+
+WORDS = (
+    "vintage leather jacket wooden toy train blender kettle toaster laptop phone camera "
+    "headphones chocolate coffee tea board game puzzle lamp chair desk watch shoes dress "
+    "speaker charger cookbook mug blanket bicycle guitar"
+).split()
+
+# Made-up brand and model names, so most words match a small share of listings
+SYLLABLES = "ka to ri mo zu ne la vi so de pa gu fe xi bo ra".split()
+VOCABULARY = WORDS + sorted({a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES[:8]})
+
+SELLER = "bench_seller"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds open listings owned by a benchmark user (reused between runs) and times "
+        "random searches with facet counts, reporting latency percentiles. "
+        "Pass --clean to delete the seeded listings afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=500000, help="Seeded listings to search")
+        parser.add_argument("--queries", type=int, default=200, help="Number of searches to time")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument("--target", type=float, default=50, help="p95 latency target in ms")
+        parser.add_argument("--clean", action="store_true", help="Delete the seeded listings afterwards")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        seller, _ = User.objects.get_or_create(username=SELLER)
+        self.seed(seller, options["listings"], rng)
+        if not has_search_index():
+            self.stdout.write(self.style.WARNING("No full-text index, searching with LIKE."))
+
+        categories = [value for value, _ in Listing.CATEGORY_CHOICES]
+        timings = []
+        queries = []
+        for _ in range(options["queries"]):
+            text = " ".join(rng.sample(VOCABULARY, rng.choice([0, 1, 1, 2])))
+            category = rng.choice([None, None] + categories)
+            min_price = rng.choice([None, Decimal(rng.randint(1, 500))])
+            max_price = rng.choice([None, min_price + 100 if min_price else Decimal(100)])
+
+            # The log holds the last 9000 queries, so once seeding fills it a capture counts nothing
+            connection.queries_log.clear()
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                listings, _ = search_listings(text, category, min_price, max_price)
+                keyset_page(listings.select_related("creator"), None)
+            timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(round(p / 100 * (len(timings) - 1))))]
+
+        self.stdout.write(
+            f"{options['queries']} searches over {options['listings']} listings: "
+            f"mean {statistics.mean(timings):.1f}ms, p50 {percentile(50):.1f}ms, "
+            f"p95 {percentile(95):.1f}ms, p99 {percentile(99):.1f}ms, max {timings[-1]:.1f}ms, "
+            f"{max(queries)} queries per search"
+        )
+        if percentile(95) <= options["target"]:
+            self.stdout.write(self.style.SUCCESS(f"p95 within the {options['target']:g}ms target."))
+        else:
+            self.stdout.write(self.style.ERROR(f"p95 over the {options['target']:g}ms target."))
+
+        if options["clean"]:
+            deleted, _ = Listing.objects.filter(creator=seller).delete()
+            seller.delete()
+            self.stdout.write(f"Deleted {deleted} seeded rows.")
+
+    def seed(self, seller, total, rng):
+        """ Creates benchmark listings until the seller has `total`, in bulk batches. """
+        existing = Listing.objects.filter(creator=seller).count()
+        categories = [value for value, _ in Listing.CATEGORY_CHOICES]
+        start = time.perf_counter()
+        for offset in range(existing, total, 5000):
+            batch = []
+            for _ in range(offset, min(offset + 5000, total)):
+                price = Decimal(rng.randint(100, 99999)) / 100
+                batch.append(Listing(
+                    creator=seller, title=" ".join(rng.sample(VOCABULARY, 3))[:32],
+                    description=" ".join(rng.choices(VOCABULARY, k=12))[:128],
+                    starting_bid=price, current_price=price, category=rng.choice(categories),
+                ))
+            Listing.objects.bulk_create(batch)
+        if total > existing:
+            # Refresh the statistics the query planner uses to choose between indexes
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            self.stdout.write(f"Seeded {total - existing} listings in {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes closed listings from every watchlist in one bulk delete. "
+        "Only needed once for listings closed before closing cleared watchers."
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = Listing.watchers.through.objects.filter(listing__is_closed=True).delete()
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} closed listings from watchlists."))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Closes listings whose end time has passed, in batches: each current bidder wins, "
+        "and watchers are notified and cleared with bulk queries. "
+        "Runs forever, checking every --interval seconds, unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=60, help="Seconds to wait between checks")
+        parser.add_argument("--batch-size", type=int, default=500, help="Listings closed per transaction")
+        parser.add_argument("--once", action="store_true", help="Close expired listings once and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            closed = self.close_expired(options["batch_size"])
+            if closed or options["verbosity"] > 1:
+                self.stdout.write(
+                    f"Closed {closed} expired listings in {time.perf_counter() - start:.2f}s."
+                )
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
+            # As between requests, drop connections that broke or outlived CONN_MAX_AGE while sleeping
+            close_old_connections()
+
+    def close_expired(self, batch_size):
+        """ Closes every listing expired as of now, `batch_size` at a time. """
+        now = timezone.now()
+        total = 0
+        while True:
+            ids = list(Listing.objects.expired(now).order_by("end_time").values_list("id", flat=True)[:batch_size])
+            total += Listing.objects.filter(id__in=ids).close()
+            if len(ids) < batch_size:
+                return total
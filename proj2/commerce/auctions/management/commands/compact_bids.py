@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Rolls up the bids on listings closed more than --days ago into one summary per "
+        "listing and bidder, and moves the bids themselves to the archive table, "
+        "in batches of --batch-size listings. Run it periodically to keep the bids table small."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=30, help="Only compact listings closed this long ago")
+        parser.add_argument("--batch-size", type=int, default=500, help="Listings compacted per transaction")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        pending = Listing.objects.filter(is_closed=True, bids_compacted=False, updated__lte=cutoff)
+        total_listings = total_bids = 0
+        while True:
+            ids = list(pending.order_by("updated").values_list("id", flat=True)[:options["batch_size"]])
+            listings, bids = Listing.objects.filter(id__in=ids).compact_bids()
+            if not listings:
+                break
+            total_listings += listings
+            total_bids += bids
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {total_bids} bids on {total_listings} closed listings."
+        ))
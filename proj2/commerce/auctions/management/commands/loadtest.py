@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates concurrent users browsing, viewing listings, bidding, commenting and "
+        "toggling their watchlist, then reports throughput, latency percentiles and "
+        "query counts per view, and integrity violations in the listings they bid on. "
+        "Runs through the test client unless --url points at a running server using "
+        "this database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users")
+        parser.add_argument("--requests", type=int, default=100, help="Requests made by each user")
+        parser.add_argument("--listings", type=int, default=50, help="Listings created to act on")
+        parser.add_argument("--url", help="Base URL of a running server, such as http://127.0.0.1:8000")
+        parser.add_argument("--mix", help="Action weights, such as index=40,listing=30,bid=15,comment=5,watchlist=10")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep", action="store_true", help="Keep the generated users and listings")
+        parser.add_argument("--output", help="File to save the JSON report to")
+
+    def handle(self, *args, **options):
+        mix = None
+        if options["mix"]:
+            try:
+                mix = {action: int(weight) for action, weight in
+                       (item.split("=") for item in options["mix"].split(","))}
+            except ValueError:
+                raise CommandError("--mix must look like index=40,listing=30")
+            unknown = set(mix) - set(loadtest.MIX)
+            if unknown:
+                raise CommandError(f"Unknown actions in --mix: {', '.join(sorted(unknown))}")
+
+        report = loadtest.run(
+            users=options["users"], requests=options["requests"], listings=options["listings"],
+            url=options["url"], mix=mix, seed=options["seed"], keep=options["keep"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(
+            f"{report['requests']} requests in {report['duration_s']:.1f}s "
+            f"({report['throughput_rps']:.0f} requests/s), {report['bids_accepted']} bids accepted"
+        )
+        for rule, count in report["integrity"].items():
+            style = self.style.ERROR if count else self.style.SUCCESS
+            self.stdout.write(style(f"{rule}: {count}"))
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved report to {options['output']}."))
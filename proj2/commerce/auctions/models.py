@@ -1,15 +1,96 @@
 from typing import DefaultDict
 from django.contrib.auth.models import AbstractUser
 from django.core import validators
-from django.db import models
+from django.db import connections, models, transaction
 from django.core.validators import MinValueValidator
+from django.db.models import Count, F, Max, Min, Q
 from django.db.models.fields import related
+from django.utils import timezone
+
+from . import events
 
 
 class User(AbstractUser):
     pass
 
 
+class ListingQuerySet(models.QuerySet):
+    def expired(self, now=None):
+        """ Open listings whose end time has passed. """
+        if now is None:
+            now = timezone.now()
+        return self.filter(is_closed=False, end_time__lte=now)
+
+    def close(self):
+        """
+        Closes every open listing in this queryset with a fixed number of queries,
+        however many there are: the current bidder of each wins it, its watchers
+        are notified, and it is removed from every watchlist.
+        Returns the number of listings closed.
+        """
+        with transaction.atomic():
+            ids = list(self.filter(is_closed=False).select_for_update().values_list("id", flat=True))
+            if not ids:
+                return 0
+
+            # Notify and remove watchers in bulk, straight from the through table
+            watchers = Listing.watchers.through.objects.filter(listing_id__in=ids)
+            Notification.objects.bulk_create([
+                Notification(user_id=user_id, listing_id=listing_id, message=f"'{title}' has closed.")
+                for user_id, listing_id, title in watchers.values_list("user_id", "listing_id", "listing__title")
+            ], batch_size=500)
+            watchers.delete()
+
+            # The winner is read in the UPDATE itself, so a bid placed meanwhile still wins
+            closed = Listing.objects.filter(id__in=ids, is_closed=False).update(
+                is_closed=True, winner=F("current_bidder"), current_bidder=None, updated=timezone.now(),
+                cache_version=F("cache_version") + 1,
+            )
+            events.publish_on_commit(ids, "closed", {})
+        return closed
+
+    def compact_bids(self):
+        """
+        Rolls up the bids on every closed listing in this queryset into one
+        `BidSummary` per bidder and moves the bids themselves to `ArchivedBid`,
+        in bulk queries (one insert per 500 rows) rather than any per bid.
+        Returns the number of listings and bids compacted.
+        """
+        with transaction.atomic():
+            ids = list(self.filter(is_closed=True, bids_compacted=False).select_for_update()
+                       .values_list("id", flat=True))
+            if not ids:
+                return 0, 0
+
+            bids = Bid.objects.filter(listing_id__in=ids)
+            BidSummary.objects.bulk_create([
+                BidSummary(listing_id=row.pop("listing"), bidder_id=row.pop("bidder"), **row)
+                for row in bids.order_by().values("listing", "bidder").annotate(
+                    bid_count=Count("id"), highest_bid=Max("price"),
+                    first_bid_at=Min("created"), last_bid_at=Max("created"),
+                )
+            ], batch_size=500)
+            archived = ArchivedBid.objects.bulk_create([
+                ArchivedBid(**bid) for bid in bids.values("id", "bidder_id", "listing_id", "price", "created")
+            ], batch_size=500)
+
+            # One DELETE without the post_delete signal of each bid, whose receiver would
+            # bump a listing's cache version once per bid. The UPDATE below bumps every
+            # compacted listing's version once, and nothing references a bid to cascade to.
+            conn = connections[bids.db]
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {conn.ops.quote_name(Bid._meta.db_table)} "
+                    f"WHERE {conn.ops.quote_name(Bid._meta.get_field('listing').column)} "
+                    f"IN ({', '.join(['%s'] * len(ids))})",
+                    ids,
+                )
+            Listing.objects.filter(id__in=ids).update(
+                bids_compacted=True, cache_version=F("cache_version") + 1
+            )
+        return len(ids), len(archived)
+
+
 class Listing(models.Model):
     """ Represents a listing for auction. """
     # List of choices for category field
@@ -36,10 +117,92 @@ class Listing(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    end_time = models.DateTimeField(blank=True, null=True)
+
+    # Bid statistics, kept up to date by `place_bid`
+    bid_count = models.PositiveIntegerField(default=0)
+    highest_bid = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    last_bid_at = models.DateTimeField(blank=True, null=True)
+
+    # Whether the bids were rolled up into `BidSummary` rows by `compact_bids`
+    bids_compacted = models.BooleanField(default=False)
+
+    # Part of the key of the listing page's cached fragments, see `auctions.caching`
+    cache_version = models.PositiveIntegerField(default=0)
+
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        # Partial indexes of open listings only. Filtering on `is_closed=False`
+        # is rendered as `NOT is_closed`, which cannot use an index on that column
+        # but does match these indexes' condition.
+        # Price ranges are searched by walking the newest first indexes until a
+        # page of listings is in range: an index on price makes SQLite sort every
+        # listing in the range instead, which is far slower for all but tiny ranges.
+        indexes = [
+            # Active listings page, optionally filtered by category, newest first
+            models.Index(fields=["category", "created"], condition=Q(is_closed=False),
+                         name="listing_open_category_idx"),
+            models.Index(fields=["created", "id"], condition=Q(is_closed=False),
+                         name="listing_open_created_idx"),
+            # Open listings due to be closed by `close_expired_auctions`
+            models.Index(fields=["end_time"], condition=Q(is_closed=False),
+                         name="listing_open_end_time_idx"),
+            # Closed listings due to have their bids compacted by `compact_bids`
+            models.Index(fields=["updated"], condition=Q(is_closed=True, bids_compacted=False),
+                         name="listing_uncompacted_idx"),
+        ]
 
     def __str__(self):
         return f"Listing: {self.title} by User: {self.creator}"
 
+    def close(self):
+        """
+        Closes the listing: the current bidder (if any) wins it, its watchers
+        are notified and it is removed from every watchlist.
+        """
+        Listing.objects.filter(pk=self.pk).close()
+        self.refresh_from_db()
+
+    @property
+    def has_expired(self):
+        """ Whether the listing is past its end time, even if not closed yet. """
+        return self.end_time is not None and self.end_time <= timezone.now()
+
+    def place_bid(self, bidder, price):
+        """
+        Places a bid of `price` on this listing by `bidder` as one atomic operation.
+        The listing is only updated if it is still open (and has not passed its
+        end time) and `price` beats the current price (or, for the first bid, at
+        least matches the starting bid), checked in the UPDATE itself so concurrent
+        bids cannot overwrite a higher one. The same UPDATE maintains the listing's
+        bid statistics. Viewers of the listing are sent the new bid once it is committed.
+        Returns the new `Bid`, or None if the bid was rejected.
+        """
+        with transaction.atomic():
+            now = timezone.now()
+            updated = Listing.objects.filter(pk=self.pk, is_closed=False).filter(
+                Q(end_time__isnull=True) | Q(end_time__gt=now)
+            ).filter(
+                Q(current_price__lt=price) | Q(current_bidder__isnull=True, current_price__lte=price)
+            ).update(
+                current_price=price, current_bidder=bidder, updated=now,
+                bid_count=F("bid_count") + 1, highest_bid=price, last_bid_at=now,
+            )
+            if not updated:
+                return None
+            bid = Bid.objects.create(bidder=bidder, listing=self, price=price)
+            events.publish_on_commit([self.pk], "bid", {
+                "price": str(price), "bidder": bidder.username, "updated": now.isoformat(),
+            })
+
+        self.current_price = price
+        self.current_bidder = bidder
+        self.bid_count += 1
+        self.highest_bid = price
+        self.last_bid_at = now
+        return bid
+
 
 class Bid(models.Model):
     """ Represents a bid for a particular `Listing`. """
@@ -53,6 +216,36 @@ class Bid(models.Model):
         return f"Bid of ${self.price} placed on {self.listing.id}: {self.listing.title}"
 
 
+class BidSummary(models.Model):
+    """ Rolls up a bidder's bids on a closed `Listing` once they are archived. """
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bid_summaries")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="bid_summaries")
+    bid_count = models.PositiveIntegerField()
+    highest_bid = models.DecimalField(max_digits=5, decimal_places=2)
+    first_bid_at = models.DateTimeField()
+    last_bid_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "bidder"], name="unique_bid_summary"),
+        ]
+
+    def __str__(self):
+        return (f"{self.bid_count} bid{'s' if self.bid_count != 1 else ''} of up to ${self.highest_bid} "
+                f"placed on {self.listing.id}: {self.listing.title}")
+
+
+class ArchivedBid(models.Model):
+    """ A `Bid` on a closed `Listing`, moved out of the bids table by `compact_bids`. """
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_bids")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="archived_bids")
+    price = models.DecimalField(max_digits=5, decimal_places=2)
+    created = models.DateTimeField()
+
+    def __str__(self):
+        return f"Archived bid of ${self.price} placed on {self.listing.id}: {self.listing.title}"
+
+
 class Comment(models.Model):
     """ Represents a comment for a particular 'Listing'. """
     commentor = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
@@ -61,5 +254,25 @@ class Comment(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A listing's comments, newest first, one page at a time
+            models.Index(fields=["listing", "created", "id"]),
+        ]
+
     def __str__(self):
         return f"Comment made by '{self.commentor}' on Listing '{self.listing.title}': '{self.comment}'"
+
+
+class Notification(models.Model):
+    """ Tells a user about a change to a `Listing` they watched, such as it closing. """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="notifications")
+    message = models.CharField(max_length=128)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created"]
+
+    def __str__(self):
+        return f"Notification for {self.user}: {self.message}"
@@ -0,0 +1,189 @@
+"""
+Search over open auction listings by text, category and price.
+
+On SQLite, titles and descriptions are indexed in an FTS5 table, and the
+number of open listings per category and price range is kept in a small
+facet table. Both are kept in sync with `auctions_listing` by triggers, so
+bulk inserts and queryset updates (such as bids and closing) are covered
+too. Other databases, or SQLite builds without FTS5, fall back to
+case-insensitive substring matches and counting with an aggregate query.
+Run ANALYZE on large databases so SQLite drives searches from the FTS
+matches rather than scanning every open listing.
+"""
+import re
+
+from django.db import OperationalError, connections
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Listing
+
+FTS_TABLE = "auctions_listing_fts"
+FACETS_TABLE = "auctions_listing_facets"
+
+# Price facets as (lower, upper) bounds, upper exclusive
+PRICE_RANGES = [(0, 10), (10, 50), (50, 100), (100, 500), (500, None)]
+
+
+def _bucket_sql(price):
+    """ SQL for the index into PRICE_RANGES of `price`, or -1 if it is NULL. """
+    cases = " ".join(f"WHEN {price} < {upper} THEN {i}"
+                     for i, (_, upper) in enumerate(PRICE_RANGES) if upper is not None)
+    return f"CASE WHEN {price} IS NULL THEN -1 {cases} ELSE {len(PRICE_RANGES) - 1} END"
+
+
+SCHEMA = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, content='auctions_listing', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_ai AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_ad AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+    END;
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_au
+    AFTER UPDATE OF title, description ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE} (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+    END;
+
+    CREATE TABLE IF NOT EXISTS {FACETS_TABLE} (
+        category TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (category, bucket)
+    ) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_facets_ai
+    AFTER INSERT ON auctions_listing WHEN NOT new.is_closed BEGIN
+        INSERT INTO {FACETS_TABLE} VALUES (new.category, {_bucket_sql("new.current_price")}, 1)
+            ON CONFLICT (category, bucket) DO UPDATE SET count = count + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_facets_ad
+    AFTER DELETE ON auctions_listing WHEN NOT old.is_closed BEGIN
+        UPDATE {FACETS_TABLE} SET count = count - 1
+            WHERE category = old.category AND bucket = {_bucket_sql("old.current_price")};
+    END;
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_facets_au
+    AFTER UPDATE OF is_closed, category, current_price ON auctions_listing BEGIN
+        UPDATE {FACETS_TABLE} SET count = count - 1
+            WHERE NOT old.is_closed
+            AND category = old.category AND bucket = {_bucket_sql("old.current_price")};
+        INSERT INTO {FACETS_TABLE} SELECT new.category, {_bucket_sql("new.current_price")}, 1
+            WHERE NOT new.is_closed
+            ON CONFLICT (category, bucket) DO UPDATE SET count = count + 1;
+    END;
+"""
+
+# Whether each database alias has the search tables, checked once per process
+_has_index = {}
+
+
+def has_search_index(using="default"):
+    """ Whether the database has the FTS and facet tables. """
+    if using not in _has_index:
+        conn = connections[using]
+        _has_index[using] = conn.vendor == "sqlite" and FACETS_TABLE in conn.introspection.table_names()
+    return _has_index[using]
+
+
+def create_index(using="default", **kwargs):
+    """
+    Creates the FTS and facet tables and their triggers, then fills them
+    from any existing listings. Connected to `post_migrate`; does nothing
+    outside SQLite or without FTS5.
+    """
+    conn = connections[using]
+    tables = conn.introspection.table_names()
+    if conn.vendor != "sqlite" or "auctions_listing" not in tables:
+        return
+    try:
+        with conn.cursor() as cursor:
+            cursor.connection.executescript(SCHEMA)
+            if FTS_TABLE not in tables:
+                cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+            if FACETS_TABLE not in tables:
+                cursor.execute(
+                    f"INSERT INTO {FACETS_TABLE} SELECT category, {_bucket_sql('current_price')}, COUNT(*) "
+                    "FROM auctions_listing WHERE NOT is_closed GROUP BY 1, 2"
+                )
+    except OperationalError:
+        # SQLite was built without FTS5
+        return
+    _has_index[using] = True
+
+
+def match_expression(query):
+    """ Turns free text into an FTS5 query matching every word as a prefix. """
+    return " ".join('"{}"*'.format(term) for term in re.findall(r"\w+", query))
+
+
+def count_facets(matches):
+    """
+    Counts `matches` per category and per price range with one aggregate query.
+    Returns a dict of category to count and a list of counts per PRICE_RANGES.
+    """
+    counts = {}
+    for value, _ in Listing.CATEGORY_CHOICES:
+        counts[f"category_{value}"] = Count("id", filter=Q(category=value))
+    for i, (lower, upper) in enumerate(PRICE_RANGES):
+        in_range = Q(current_price__gte=lower)
+        if upper is not None:
+            in_range &= Q(current_price__lt=upper)
+        counts[f"price_{i}"] = Count("id", filter=in_range)
+    totals = matches.aggregate(**counts)
+    categories = {value: totals[f"category_{value}"] for value, _ in Listing.CATEGORY_CHOICES}
+    return categories, [totals[f"price_{i}"] for i in range(len(PRICE_RANGES))]
+
+
+def stored_facets(using="default"):
+    """ Reads the counts of every open listing from the facet table, like `count_facets`. """
+    categories = {value: 0 for value, _ in Listing.CATEGORY_CHOICES}
+    prices = [0] * len(PRICE_RANGES)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT category, bucket, count FROM {FACETS_TABLE}")
+        for category, bucket, count in cursor.fetchall():
+            categories[category] = categories.get(category, 0) + count
+            if bucket >= 0:
+                prices[bucket] += count
+    return categories, prices
+
+
+def search_listings(query="", category=None, min_price=None, max_price=None):
+    """
+    Returns (listings, facets) for open listings matching every word of
+    `query` in their title or description, in `category` and within the
+    price range. `listings` is an unevaluated queryset.
+    `facets` counts the listings matching `query` alone in each category
+    and price range, in one query whatever the number of matches.
+    """
+    matches = Listing.objects.filter(is_closed=False)
+    if query and has_search_index():
+        matches = matches.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            (match_expression(query) or '""',),
+        ))
+    elif query:
+        for term in query.split():
+            matches = matches.filter(Q(title__icontains=term) | Q(description__icontains=term))
+
+    if query or not has_search_index():
+        categories, prices = count_facets(matches)
+    else:
+        categories, prices = stored_facets()
+    facets = {
+        "categories": [(value, name, categories[value]) for value, name in Listing.CATEGORY_CHOICES],
+        "prices": [(lower, upper, count) for (lower, upper), count in zip(PRICE_RANGES, prices)],
+    }
+
+    if category:
+        matches = matches.filter(category=category)
+    if min_price is not None:
+        matches = matches.filter(current_price__gte=min_price)
+    if max_price is not None:
+        matches = matches.filter(current_price__lte=max_price)
+    return matches, facets
@@ -0,0 +1,31 @@
+// Loads older comments on a listing, one page at a time
+document.addEventListener("DOMContentLoaded", () => {
+    const button = document.querySelector("#loadComments")
+    if (!button) {
+        return
+    }
+
+    button.addEventListener("click", () => {
+        fetch(`${button.dataset.url}?cursor=${encodeURIComponent(button.dataset.cursor)}`)
+        .then(response => response.json())
+        .then(data => {
+            // Append each comment below the ones already shown
+            data.comments.forEach(comment => {
+                const commentor = document.createElement("div")
+                commentor.innerHTML = "<b></b>"
+                commentor.firstChild.textContent = comment.commentor
+                const text = document.createElement("div")
+                text.innerHTML = "<i></i>"
+                text.firstChild.textContent = comment.comment
+                document.querySelector("#comments").append(commentor, text)
+            })
+
+            // Hide the button once the oldest comment is shown
+            if (data.next) {
+                button.dataset.cursor = data.next
+            } else {
+                button.style.display = "none"
+            }
+        })
+    })
+})
@@ -0,0 +1,26 @@
+// Shows new bids and closures on an open listing as they happen
+const eventsUrl = document.currentScript.dataset.eventsUrl
+
+document.addEventListener("DOMContentLoaded", () => {
+    const source = new EventSource(eventsUrl)
+
+    // Someone placed a bid - update the price and bidder in place, as text since usernames are user input
+    source.addEventListener("bid", event => {
+        const data = JSON.parse(event.data)
+        document.querySelector("#current-price").textContent = data.price
+        document.querySelector("#current-bidder").textContent = data.bidder
+        document.querySelector("#last-updated").textContent = new Date(data.updated).toLocaleString()
+
+        // Bids must now beat the new price
+        const price = document.querySelector("#id_price")
+        if (price) {
+            price.min = data.price
+        }
+    })
+
+    // Listing closed - reload to show the winner
+    source.addEventListener("closed", () => {
+        source.close()
+        window.location.reload()
+    })
+})
@@ -1,3 +1,594 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import events, loadtest, search
+from .asgi import listing_events
+from .management.commands import close_expired_auctions
+from .models import User, Listing, Bid, BidSummary, ArchivedBid, Comment, Notification
+
+
+def listing_fields(creator, title="Listing", price=5, **fields):
+    """ Returns the fields of an open listing starting at `price`, with placeholder defaults. """
+    return {
+        "creator": creator, "title": title, "description": "A listing",
+        "starting_bid": price, "current_price": price, "category": "toys", **fields
+    }
+
+
+def create_listing(creator, title="Listing", price=5, **fields):
+    """ Creates an open listing starting at `price`. """
+    return Listing.objects.create(**listing_fields(creator, title, price, **fields))
+
+
+class AuctionTestCase(TestCase):
+    """ Test case with a listing creator and two bidders, of which `bidder` can log in. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create_user("creator")
+        cls.bidder = User.objects.create_user("bidder", password="password")
+        cls.rival = User.objects.create_user("rival")
+
+
+class IndexTests(AuctionTestCase):
+    """ Tests for the active listings page. """
+
+    def create_listings(self, n, category="toys"):
+        users = [self.creator, self.bidder, self.rival]
+        for i in range(n):
+            create_listing(users[i % len(users)], f"Listing {i}", 1, category=category)
+
+    def test_query_count_is_constant(self):
+        """ Listing rows do not issue a query each for their creator. """
+        self.create_listings(5)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("index"))
+        self.create_listings(50)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("index"))
+
+    @override_settings(AUCTIONS_PAGE_SIZE=10)
+    def test_pagination(self):
+        """ Following the next cursor visits every active listing exactly once. """
+        self.create_listings(25)
+        Listing.objects.filter(title="Listing 0").update(is_closed=True)
+        seen = []
+        response = self.client.get(reverse("index"))
+        while True:
+            seen += [listing.id for listing in response.context["active_listings"]]
+            if response.context["next_cursor"] is None:
+                break
+            response = self.client.get(reverse("index"), {"cursor": response.context["next_cursor"]})
+        self.assertEqual(len(seen), 24)
+        self.assertEqual(len(set(seen)), 24)
+
+    def test_category_filter(self):
+        self.create_listings(3, category="toys")
+        self.create_listings(2, category="food")
+        response = self.client.get(reverse("index"), {"category": "food"})
+        self.assertEqual(len(response.context["active_listings"]), 2)
+
+
+class SearchTests(AuctionTestCase):
+    """ Tests for searching open listings and counting facets. """
+
+    def setUp(self):
+        self.lamp = self.create("Brass lamp", "A vintage reading lamp", "home_appliances", 40)
+        self.radio = self.create("Radio", "Vintage transistor radio", "electronics", 120)
+        self.train = self.create("Toy train", "Wooden train set", "toys", 8)
+
+    def create(self, title, description, category, price):
+        return create_listing(self.creator, title, price, description=description, category=category)
+
+    def titles(self, *args):
+        listings, _ = search.search_listings(*args)
+        return sorted(listing.title for listing in listings)
+
+    def test_full_text_index_is_used(self):
+        self.assertTrue(search.has_search_index())
+
+    def test_text_category_and_price(self):
+        self.assertEqual(self.titles("vintage"), ["Brass lamp", "Radio"])
+        self.assertEqual(self.titles("vint"), ["Brass lamp", "Radio"])
+        self.assertEqual(self.titles("vintage radio"), ["Radio"])
+        self.assertEqual(self.titles("vintage", "electronics"), ["Radio"])
+        self.assertEqual(self.titles("", None, 10, 100), ["Brass lamp"])
+        self.assertEqual(self.titles("", None, None, 10), ["Toy train"])
+
+    def test_index_follows_edits_and_closing(self):
+        self.lamp.title = "Desk light"
+        self.lamp.save()
+        self.assertEqual(self.titles("brass"), [])
+        self.assertEqual(self.titles("desk"), ["Desk light"])
+        self.radio.close()
+        self.assertEqual(self.titles("vintage"), ["Desk light"])
+
+    def test_facets(self):
+        """ Stored counts of all open listings agree with counting matches. """
+        self.radio.place_bid(self.bidder, 600)
+        self.train.close()
+        self.create("Lamp shade", "Shade for a lamp", "home_appliances", 5)
+        _, facets = search.search_listings("lamp")
+        categories = {value: count for value, _, count in facets["categories"]}
+        self.assertEqual(categories["home_appliances"], 2)
+        self.assertEqual([count for _, _, count in facets["prices"]], [1, 1, 0, 0, 0])
+
+        stored = search.stored_facets()
+        counted = search.count_facets(Listing.objects.filter(is_closed=False))
+        self.assertEqual(stored, counted)
+        self.assertEqual(stored[1], [1, 1, 0, 0, 1])
+
+    def test_benchmark_counts_queries(self):
+        # A query log already full, as after seeding many listings
+        connection.queries_log.extend([{"sql": "", "time": "0"}] * connection.queries_log.maxlen)
+        out = StringIO()
+        call_command("bench_search", listings=20, queries=10, stdout=out)
+        self.assertIn("Seeded 20 listings", out.getvalue())
+        queries = int(re.search(r"(\d+) queries per search", out.getvalue()).group(1))
+        self.assertGreater(queries, 0)
+
+    def test_view(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("search"), {"q": "vintage", "max_price": "100"})
+        self.assertEqual([listing.title for listing in response.context["listings"]], ["Brass lamp"])
+        self.assertContains(response, "Electronics (1)")
+
+
+class PlaceBidTests(AuctionTestCase):
+    """ Tests for `Listing.place_bid`. """
+
+    def setUp(self):
+        self.bidders = [self.bidder, self.rival]
+        self.listing = create_listing(self.creator)
+
+    def test_first_bid_may_match_starting_bid(self):
+        self.assertIsNotNone(self.listing.place_bid(self.bidders[0], 5))
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bidder, self.bidders[0])
+
+    def test_stale_lower_bid_is_rejected(self):
+        """ A bid validated against an outdated price cannot overwrite a higher bid. """
+        stale = Listing.objects.get(pk=self.listing.pk)
+        self.listing.place_bid(self.bidders[0], 8)
+        self.assertIsNone(stale.place_bid(self.bidders[1], 7))
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, 8)
+        self.assertEqual(self.listing.current_bidder, self.bidders[0])
+        self.assertEqual(self.listing.bids.count(), 1)
+
+    def test_closed_listing_rejects_bids(self):
+        Listing.objects.filter(pk=self.listing.pk).update(is_closed=True)
+        self.assertIsNone(self.listing.place_bid(self.bidders[0], 10))
+
+
+class ProfileTests(AuctionTestCase):
+    """ Tests for bid statistics and the user profile page. """
+
+    def create_bids(self, n):
+        for i in range(n):
+            listing = create_listing(self.creator, f"Listing {i}")
+            listing.place_bid(self.rival, 6)
+            listing.place_bid(self.bidder, 7)
+            if i % 2:
+                listing.close()
+
+    def test_bid_statistics(self):
+        self.create_bids(1)
+        listing = Listing.objects.get()
+        self.assertEqual(listing.bid_count, 2)
+        self.assertEqual(listing.highest_bid, 7)
+        self.assertLessEqual(listing.last_bid_at, listing.bids.latest("created").created)
+
+    def test_backfill_bid_stats(self):
+        self.create_bids(2)
+        Listing.objects.update(bid_count=0, highest_bid=None, last_bid_at=None)
+        out = StringIO()
+        call_command("backfill_bid_stats", stdout=out)
+        self.assertIn("Updated bid statistics of 2 listings.", out.getvalue())
+        for listing in Listing.objects.all():
+            self.assertEqual(listing.bid_count, 2)
+            self.assertEqual(listing.highest_bid, 7)
+
+    def test_query_count_is_constant(self):
+        """ The profile page does not issue queries per listing or bid. """
+        self.client.login(username="bidder", password="password")
+        for n in (2, 20):
+            self.create_bids(n)
+            # Session, user, then notifications, leading bids, wins, created listings,
+            # bids and bid summaries
+            with self.assertNumQueries(8):
+                response = self.client.get(reverse("user_profile"))
+        self.assertEqual(len(response.context["bids"]), 22)
+
+
+class CompactBidsTests(AuctionTestCase):
+    """ Tests for rolling up and archiving the bids of closed listings. """
+
+    def setUp(self):
+        self.closed, self.open = [create_listing(self.creator, title) for title in ("Closed", "Open")]
+        for listing in (self.closed, self.open):
+            listing.place_bid(self.bidder, 6)
+            listing.place_bid(self.rival, 7)
+            listing.place_bid(self.bidder, 8)
+        self.closed.close()
+
+    def compact(self):
+        out = StringIO()
+        call_command("compact_bids", days=0, stdout=out)
+        return out.getvalue()
+
+    def test_closed_listings_are_compacted(self):
+        self.assertIn("Compacted 3 bids on 1 closed listings.", self.compact())
+        self.assertFalse(Bid.objects.filter(listing=self.closed).exists())
+        self.assertEqual(Bid.objects.filter(listing=self.open).count(), 3)
+        self.assertEqual(ArchivedBid.objects.filter(listing=self.closed).count(), 3)
+        summary = BidSummary.objects.get(listing=self.closed, bidder=self.bidder)
+        self.assertEqual((summary.bid_count, summary.highest_bid), (2, 8))
+        self.assertLess(summary.first_bid_at, summary.last_bid_at)
+
+        listing = Listing.objects.get(pk=self.closed.pk)
+        self.assertTrue(listing.bids_compacted)
+        self.assertEqual((listing.bid_count, listing.highest_bid), (3, 8))
+
+    def test_query_count_is_constant(self):
+        """ Compacting issues the same queries however many bids there are, up to 500. """
+        for n in (2, 50):
+            listing = create_listing(self.creator, f"Listing {n}")
+            for i in range(n):
+                listing.place_bid(self.bidder if i % 2 else self.rival, 6 + i)
+            listing.close()
+            # Savepoint, listings, summaries and their insert, bids and their insert,
+            # delete, update and release
+            with self.assertNumQueries(9):
+                self.assertEqual(Listing.objects.filter(pk=listing.pk).compact_bids(), (1, n))
+            self.assertFalse(Bid.objects.filter(listing=listing).exists())
+            self.assertEqual(ArchivedBid.objects.filter(listing=listing).count(), n)
+
+    def test_compacting_invalidates_cached_fragments(self):
+        version = Listing.objects.get(pk=self.closed.pk).cache_version
+        self.compact()
+        self.assertEqual(Listing.objects.get(pk=self.closed.pk).cache_version, version + 1)
+
+    def test_recently_closed_listings_are_kept(self):
+        out = StringIO()
+        call_command("compact_bids", stdout=out)
+        self.assertIn("Compacted 0 bids on 0 closed listings.", out.getvalue())
+        self.assertFalse(ArchivedBid.objects.exists())
+
+    def test_compacting_again_does_nothing(self):
+        self.compact()
+        self.assertIn("Compacted 0 bids", self.compact())
+        self.assertEqual(BidSummary.objects.count(), 2)
+        self.assertEqual(ArchivedBid.objects.count(), 3)
+
+    def test_backfill_keeps_compacted_statistics(self):
+        self.compact()
+        out = StringIO()
+        call_command("backfill_bid_stats", stdout=out)
+        self.assertIn("Updated bid statistics of 1 listings.", out.getvalue())
+        self.assertEqual(Listing.objects.get(pk=self.closed.pk).bid_count, 3)
+
+    def test_pages_read_summaries(self):
+        self.compact()
+        self.client.login(username="bidder", password="password")
+        history = self.client.get(reverse("user_profile")).context["bids"]
+        self.assertEqual([type(bid) for bid in history], [Bid, Bid, BidSummary])
+        self.assertContains(self.client.get(reverse("listing", args=[self.closed.id])), "(2 bids, last on")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    AUCTIONS_CACHE="default",
+)
+class FragmentCacheTests(AuctionTestCase):
+    """ Tests for the cached fragments of listing pages. """
+
+    def setUp(self):
+        caches["default"].clear()
+        self.listing = create_listing(self.creator)
+        Comment.objects.create(commentor=self.bidder, listing=self.listing, comment="First!")
+
+    def get(self):
+        return self.client.get(reverse("listing", args=[self.listing.id]))
+
+    def test_cached_fragments_skip_queries(self):
+        # Listing and creator, bids and comments
+        with self.assertNumQueries(3):
+            self.get()
+        # Only the listing itself is queried once its fragments are cached
+        with self.assertNumQueries(1):
+            response = self.get()
+        self.assertContains(response, "First!")
+
+    def test_bid_comment_and_close_invalidate(self):
+        self.get()
+        self.listing.place_bid(self.bidder, 12)
+        self.assertContains(self.get(), "$12.00 by bidder")
+
+        Comment.objects.create(commentor=self.creator, listing=self.listing, comment="Thanks")
+        self.assertContains(self.get(), "Thanks")
+
+        self.listing.title = "Renamed"
+        self.listing.save()
+        self.assertContains(self.get(), "Renamed")
+
+        version = Listing.objects.get().cache_version
+        self.listing.close()
+        self.assertEqual(self.listing.cache_version, version + 1)
+        self.assertContains(self.get(), "Current bidder: <span id=\"current-bidder\">None")
+
+
+@override_settings(AUCTIONS_COMMENTS_PAGE_SIZE=10)
+class CommentTests(AuctionTestCase):
+    """ Tests for paginated comments on listing pages. """
+
+    def setUp(self):
+        caches["default"].clear()
+        users = [self.creator, self.bidder, self.rival]
+        self.listing = create_listing(self.creator)
+        Comment.objects.bulk_create([
+            Comment(commentor=users[i % 3], listing=self.listing, comment=f"Comment {i}")
+            for i in range(25)
+        ])
+
+    def test_pages(self):
+        """ Every comment is served once, newest first, with one query per page. """
+        seen = []
+        cursor = None
+        for _ in range(3):
+            with self.assertNumQueries(1):
+                response = self.client.get(
+                    reverse("comments", args=[self.listing.id]), {"cursor": cursor} if cursor else {}
+                )
+            data = response.json()
+            self.assertLessEqual(len(data["comments"]), 10)
+            seen += [comment["comment"] for comment in data["comments"]]
+            cursor = data["next"]
+        self.assertIsNone(cursor)
+        self.assertEqual(seen, [f"Comment {i}" for i in reversed(range(25))])
+        self.assertEqual(data["comments"][-1]["commentor"], "creator")
+
+    def test_listing_page_shows_newest_page(self):
+        response = self.client.get(reverse("listing", args=[self.listing.id]))
+        self.assertContains(response, "Comment 24")
+        self.assertContains(response, "Comment 15")
+        self.assertNotContains(response, "Comment 14<")
+        self.assertContains(response, "Load more comments")
+
+
+class WatchlistTests(AuctionTestCase):
+    """ Tests for watchlists of open and closed listings. """
+
+    def setUp(self):
+        self.watcher = self.bidder
+        self.listings = [create_listing(self.creator, f"Listing {i}") for i in range(3)]
+        for listing in self.listings:
+            listing.watchers.add(self.watcher)
+
+    def test_closing_clears_watchers(self):
+        self.listings[0].close()
+        self.assertEqual(self.listings[0].watchers.count(), 0)
+        self.assertEqual(self.watcher.watchlist.count(), 2)
+
+    def test_clear_closed_watchers(self):
+        """ Listings closed before closing cleared watchers leave every watchlist. """
+        Listing.objects.filter(pk=self.listings[0].pk).update(is_closed=True)
+        self.listings[1].watchers.add(self.rival)
+        out = StringIO()
+        call_command("clear_closed_watchers", stdout=out)
+        self.assertIn("Removed 1 closed listings from watchlists.", out.getvalue())
+        self.assertEqual(self.listings[0].watchers.count(), 0)
+        self.assertEqual(list(self.watcher.watchlist.order_by("id")), self.listings[1:])
+        self.assertEqual(self.rival.watchlist.get(), self.listings[1])
+
+    def test_watchlist_query_count_is_constant(self):
+        self.client.login(username="bidder", password="password")
+        self.listings[1].close()
+        # Session, user and watchlist
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("watchlist"))
+        self.assertEqual(len(response.context["watchlist"]), 2)
+
+
+class ExpiryTests(AuctionTestCase):
+    """ Tests for closing listings once their end time passes. """
+
+    def setUp(self):
+        self.bidders = [self.bidder, self.rival]
+
+    def create_listings(self, n, end_time):
+        Listing.objects.bulk_create([
+            Listing(**listing_fields(self.creator, f"Listing {i}", end_time=end_time)) for i in range(n)
+        ])
+        return list(Listing.objects.filter(end_time=end_time))
+
+    def test_query_count_is_constant(self):
+        """ Closing a batch of listings does not issue queries per listing or watcher. """
+        past = timezone.now() - timedelta(minutes=1)
+        for n in (5, 50):
+            for listing in self.create_listings(n, past):
+                listing.watchers.add(*self.bidders)
+            # Select, watchers, notifications, delete watchers and update, in a savepoint
+            with self.assertNumQueries(7):
+                self.assertEqual(Listing.objects.expired().close(), n)
+
+    def test_close_expired_auctions(self):
+        past = timezone.now() - timedelta(minutes=1)
+        future = timezone.now() + timedelta(days=1)
+        running = self.create_listings(3, future)
+        expired = self.create_listings(6, past)
+        # A bid placed while the listing was still running wins it
+        running[0].place_bid(self.bidders[0], 6)
+        running[0].watchers.add(self.bidders[1])
+        Listing.objects.filter(pk=running[0].pk).update(end_time=past)
+        expired.insert(0, running.pop(0))
+
+        out = StringIO()
+        call_command("close_expired_auctions", once=True, batch_size=3, stdout=out)
+        self.assertIn("Closed 7 expired listings", out.getvalue())
+
+        self.assertFalse(Listing.objects.filter(is_closed=False, end_time=past).exists())
+        self.assertFalse(Listing.objects.filter(is_closed=True, end_time=future).exists())
+        expired[0].refresh_from_db()
+        self.assertEqual(expired[0].winner, self.bidders[0])
+        self.assertIsNone(expired[0].current_bidder)
+        self.assertEqual(expired[0].watchers.count(), 0)
+        self.assertEqual(Notification.objects.get(user=self.bidders[1]).listing, expired[0])
+
+    def test_polling_refreshes_connections(self):
+        """ Each check after sleeping runs on a fresh connection and closes what expired meanwhile. """
+        past = timezone.now() - timedelta(minutes=1)
+        checks = []
+
+        def sleep(interval):
+            checks.append(interval)
+            if len(checks) == 2:
+                raise KeyboardInterrupt
+            self.create_listings(2, past)
+
+        with mock.patch.object(close_expired_auctions, "close_old_connections") as close_old_connections:
+            with mock.patch.object(close_expired_auctions.time, "sleep", sleep):
+                with self.assertRaises(KeyboardInterrupt):
+                    call_command("close_expired_auctions", interval=5, stdout=StringIO())
+        self.assertEqual(checks, [5, 5])
+        self.assertEqual(close_old_connections.call_count, 1)
+        self.assertFalse(Listing.objects.filter(is_closed=False).exists())
+
+    def test_expired_listing_rejects_bids(self):
+        listing = self.create_listings(1, timezone.now() - timedelta(seconds=1))[0]
+        self.assertIsNone(listing.place_bid(self.bidders[0], 10))
+
+
+class RecordingBroker:
+    """ Broker that keeps every published message, for tests. """
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+@override_settings(AUCTIONS_EVENT_BROKER="auctions.tests.RecordingBroker")
+class PublishTests(TransactionTestCase):
+    """ Tests that bids and closures are published once committed. """
+
+    def setUp(self):
+        events._broker = None
+        self.bidder = User.objects.create_user("bidder")
+        self.listing = create_listing(User.objects.create_user("creator"))
+
+    def tearDown(self):
+        events._broker = None
+
+    def test_bid_and_close_are_published(self):
+        channel = events.listing_channel(self.listing.id)
+        self.listing.place_bid(self.bidder, 6)
+        self.listing.close()
+        published = events.get_broker().published
+        self.assertEqual([c for c, _ in published], [channel, channel])
+        self.assertIn(b"event: bid\n", published[0][1])
+        data = json.loads(published[0][1].decode().split("data: ")[1])
+        self.assertEqual((data["price"], data["bidder"]), ("6", "bidder"))
+        self.assertTrue(published[1][1].startswith(b"event: closed\n"))
+
+    def test_rolled_back_bid_is_not_published(self):
+        try:
+            with transaction.atomic():
+                self.listing.place_bid(self.bidder, 6)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(events.get_broker().published, [])
+
+
+class LoadTestTests(TransactionTestCase):
+    """ Tests the load generator behind the `loadtest` command through the test client. """
+
+    def test_queries_are_counted_past_the_query_log_limit(self):
+        # Each worker's connection keeps a log of only 10 queries
+        with mock.patch.object(BaseDatabaseWrapper, "queries_limit", 10):
+            report = loadtest.run(users=1, requests=20, listings=2, mix={"listing": 1})
+        self.assertGreaterEqual(report["views"]["listing"]["mean_queries"], 1)
+
+    def test_run_reports_views_and_integrity(self):
+        # One user, as the in-memory test database locks tables against concurrent writes
+        report = loadtest.run(users=1, requests=30, listings=3, mix={"listing": 1, "bid": 2})
+        self.assertEqual(report["requests"], 30)
+        self.assertEqual(set(report["views"]), {"listing", "bid"})
+        self.assertLessEqual(report["views"]["listing"]["max_queries"], 7)
+        self.assertEqual(sum(stats["errors"] for stats in report["views"].values()), 0)
+        self.assertGreater(report["bids_accepted"], 0)
+        self.assertEqual(set(report["integrity"].values()), {0})
+        self.assertFalse(User.objects.filter(username__startswith="loadtest_").exists())
+
+
+@override_settings(AUCTIONS_EVENT_BROKER="auctions.events.InProcessBroker")
+class EventStreamTests(SimpleTestCase):
+    """ Tests for the server-sent event stream of a listing. """
+
+    CONNECTIONS = 2000
+
+    def setUp(self):
+        events._broker = None
+
+    def tearDown(self):
+        events._broker = None
+
+    def test_idle_connections(self):
+        """ Thousands of idle streams share one event loop cheaply and all get each event. """
+        async def run():
+            broker = events.get_broker()
+            channel = events.listing_channel(1)
+            disconnects = []
+            received = [[] for _ in range(self.CONNECTIONS)]
+
+            def connection(i):
+                disconnect = asyncio.get_running_loop().create_future()
+                disconnects.append(disconnect)
+
+                async def receive():
+                    return await disconnect
+
+                async def send(message):
+                    received[i].append(message)
+                return listing_events({"type": "http"}, receive, send, 1)
+
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            tasks = [asyncio.ensure_future(connection(i)) for i in range(self.CONNECTIONS)]
+            while broker.subscriber_count(channel) < self.CONNECTIONS:
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.01)
+            per_connection = (tracemalloc.get_traced_memory()[0] - before) / self.CONNECTIONS
+            tracemalloc.stop()
+
+            message = events.encode("bid", {"price": "6.00"})
+            broker.publish(channel, message)
+            while any(len(messages) < 3 for messages in received):
+                await asyncio.sleep(0.001)
+
+            for disconnect in disconnects:
+                disconnect.set_result({"type": "http.disconnect"})
+            await asyncio.gather(*tasks)
+            return received, per_connection, broker.subscriber_count(channel)
+
+        received, per_connection, remaining = asyncio.run(run())
+        for messages in received:
+            self.assertEqual(messages[0]["status"], 200)
+            self.assertEqual(messages[2]["body"], events.encode("bid", {"price": "6.00"}))
+        self.assertLess(per_connection, 16 * 1024)
+        self.assertEqual(remaining, 0)
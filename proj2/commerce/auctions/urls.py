@@ -4,12 +4,15 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("search", views.search, name="search"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     path("create", views.create, name="create"),
     path("listing/<int:listing_id>", views.listing, name="listing"),
+    path("listing/<int:listing_id>/events", views.listing_events, name="listing_events"),
     path("profile", views.user_profile, name="user_profile"),
     path("watchlist", views.watchlist, name="watchlist"),
-    path("comment/<int:listing_id>", views.comment, name="comment")
+    path("comment/<int:listing_id>", views.comment, name="comment"),
+    path("listing/<int:listing_id>/comments", views.comments, name="comments"),
 ]
@@ -1,23 +1,108 @@
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from django import forms
 
-from .models import User, Listing, Comment
-from .forms import CreateListingForm, NewBidForm, NewCommentForm
+from .models import User, Listing, Bid, Comment
+from .forms import CreateListingForm, NewBidForm, NewCommentForm, SearchForm
+from .caching import fragment_cache
+from .search import search_listings
+
+
+def keyset_page(items, cursor, page_size=None):
+    """
+    Returns one page of `items` (listings or comments), newest first, starting
+    after `cursor` (the creation time and id of the last item on the previous
+    page), along with the cursor of the next page or None if this is the last.
+    """
+    if cursor:
+        try:
+            created, item_id = cursor.rsplit("_", 1)
+            created, item_id = datetime.fromisoformat(created), int(item_id)
+        except ValueError:
+            pass
+        else:
+            items = items.filter(Q(created__lt=created) | Q(created=created, id__lt=item_id))
+
+    if page_size is None:
+        page_size = getattr(settings, "AUCTIONS_PAGE_SIZE", 20)
+    page = list(items.order_by("-created", "-id")[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = f"{page[-1].created.isoformat()}_{page[-1].id}"
+    return page, next_cursor
 
 
 def index(request):
     """
     Default view for auctions app.
-    Display all active listings.
+    Display active listings, newest first, one page at a time.
+    Optionally filter by `category`. Pages are addressed by a keyset `cursor`
+    (the creation time and id of the last listing on the previous page),
+    so each page is a single indexed query however many listings there are.
     """
-    # Obtain all currently active listings
-    active_listings = Listing.objects.exclude(is_closed=True)
-    return render(request, "auctions/index.html", {"active_listings": active_listings})
+    # Obtain currently active listings, with their creators in the same query
+    active_listings = Listing.objects.filter(is_closed=False).select_related("creator")
+
+    category = request.GET.get("category")
+    if category:
+        active_listings = active_listings.filter(category=category)
+
+    page, next_cursor = keyset_page(active_listings, request.GET.get("cursor"))
+
+    return render(request, "auctions/index.html", {
+        "active_listings": page,
+        "categories": Listing.CATEGORY_CHOICES,
+        "category": category,
+        "next_cursor": next_cursor,
+    })
+
+
+def search(request):
+    """
+    Search open listings by text in their title or description,
+    category and price range, one page at a time like `index`.
+    Also counts the matches in each category and price range.
+    """
+    form = SearchForm(request.GET)
+    if not form.is_valid():
+        return render(request, "auctions/search.html", {"form": form})
+
+    data = form.cleaned_data
+    listings, facets = search_listings(data["q"], data["category"], data["min_price"], data["max_price"])
+    page, next_cursor = keyset_page(listings.select_related("creator"), request.GET.get("cursor"))
+
+    # Links that narrow the current search to one category or price range
+    def link(**changes):
+        params = request.GET.copy()
+        params.pop("cursor", None)
+        for key, value in changes.items():
+            params[key] = "" if value is None else value
+        return f"?{params.urlencode()}"
+
+    categories = [
+        (name, count, link(category=value)) for value, name, count in facets["categories"]
+    ]
+    prices = [
+        (lower, upper, count, link(min_price=lower, max_price=upper - Decimal("0.01") if upper else None))
+        for lower, upper, count in facets["prices"]
+    ]
+    return render(request, "auctions/search.html", {
+        "form": form,
+        "listings": page,
+        "categories": categories,
+        "prices": prices,
+        "next_page": link(cursor=next_cursor) if next_cursor else None,
+    })
 
 
 def login_view(request):
@@ -107,10 +192,28 @@ def listing(request, listing_id):
     If user signed in on a closed listing, they win if they have the highest current bid.
     If user is signed in, they should be able to make comments which are displayed.
     """
-    # Retrieve info on the given listing
-    listing = Listing.objects.get(pk=listing_id)
+    # Retrieve info on the given listing, with its creator for the creator checks
+    listing = Listing.objects.select_related("creator").get(pk=listing_id)
+
+    # Close an expired listing the worker has not got to yet
+    if not listing.is_closed and listing.has_expired:
+        listing.close()
     current_price = listing.current_price
 
+    # Bids and comments are only queried if their cached fragments are missing,
+    # and only the newest page of comments is shown until more are loaded.
+    # The bids of a compacted listing are shown as one summary per bidder.
+    if listing.bids_compacted:
+        bids = listing.bid_summaries.select_related("bidder").order_by("-highest_bid")[:10]
+    else:
+        bids = listing.bids.select_related("bidder").order_by("-created")[:10]
+    context = {
+        "listing": listing,
+        "bids": bids,
+        "comments_page": lambda: comments_page(listing.id, None),
+        **fragment_cache(),
+    }
+
     # Creator view - creators can close their listings
     if request.user == listing.creator:
 
@@ -118,41 +221,38 @@ def listing(request, listing_id):
         if request.method == "POST":
             form = forms.Form(request.POST)
             if form.is_valid():
-                # Update fields for `listing` model instance
-                listing.is_closed = True
-                listing.winner = listing.current_bidder
-                listing.current_bidder = None
-                listing.save()
+                # Close listing, declaring the current bidder the winner
+                listing.close()
                 return HttpResponseRedirect(reverse("index"))
 
         # Display form to close listing
         else:
-            return render(request, "auctions/listing.html", {"listing": listing})
+            return render(request, "auctions/listing.html", context)
 
     # Default non-creator view - users can make bids or add to watchlist
     else:
 
         # If listing is closed, check for winner
         if listing.is_closed:
-            return render(request, "auctions/listing.html", {"listing": listing})
+            return render(request, "auctions/listing.html", context)
 
         # Normal bidding view for non-winners and non-creators
         # User submitted bid form
         if request.method == "POST":
+            if not request.user.is_authenticated:
+                return HttpResponseRedirect(reverse("login"))
+
             form = NewBidForm(request.POST, min_bid=current_price)
             if form.is_valid():
-                # Save NewBidForm to Bid model
-                new_bid = form.save()
-                # Update listing with current price and bidder
-                if new_bid.price > listing.current_price:
-                    listing.current_price = new_bid.price
-                    listing.current_bidder = new_bid.bidder
-                    listing.save()
-                return HttpResponseRedirect(reverse("index"))
-            else:
-                return render(
-                    request, "auctions/listing.html", {"listing": listing, "form": form}
-                )
+                # Save bid and update listing with current price and bidder in one step,
+                # which fails if another bid beat this one in the meantime
+                if listing.place_bid(request.user, form.cleaned_data["price"]) is not None:
+                    return HttpResponseRedirect(reverse("index"))
+                listing.refresh_from_db()
+                form.add_error("price", "Enter a bid higher than the current price.")
+            return render(
+                request, "auctions/listing.html", {**context, "form": form}
+            )
 
         # User accessing bid form
         else:
@@ -162,16 +262,51 @@ def listing(request, listing_id):
             )
 
             return render(
-                request, "auctions/listing.html", {"listing": listing, "form": form}
+                request, "auctions/listing.html", {**context, "form": form}
             )
 
 
+def listing_events(request, listing_id):
+    """
+    Live updates for a listing are streamed by `auctions.asgi` in front of Django.
+    Reaching this view means the site is served over WSGI without them, and
+    204 No Content tells the browser's EventSource not to reconnect.
+    """
+    return HttpResponse(status=204)
+
+
 @login_required(login_url="/login")
 def user_profile(request):
     """
-    User profile that displays their wins, leading bids, created listings and history of bids.
+    User profile that displays their notifications, wins, leading bids,
+    created listings and history of bids.
+    Each section is one query with the rows it displays joined in, and
+    bid counts come from the listings themselves rather than counting bids.
+    The history of bids also reads the summaries of compacted listings.
+    """
+    user = request.user
+    return render(request, "auctions/user_profile.html", {
+        "user": user,
+        "notifications": user.notifications.select_related("listing")[:20],
+        "leading_bids": user.leading_bids.select_related("creator").order_by("-last_bid_at"),
+        "wins": user.wins.select_related("creator").order_by("-updated"),
+        "created_listings": user.created_listings.select_related("creator").order_by("-created"),
+        "bids": bid_history(user),
+    })
+
+
+def bid_history(user):
+    """
+    Returns a user's bids, newest first. Their bids on listings compacted by
+    `compact_bids` are each replaced by the `BidSummary` of that listing.
     """
-    return render(request, "auctions/user_profile.html", {"user": request.user})
+    bids = list(user.bids.select_related("listing"))
+    summaries = list(user.bid_summaries.select_related("listing"))
+    return sorted(
+        bids + summaries,
+        key=lambda bid: bid.created if isinstance(bid, Bid) else bid.last_bid_at,
+        reverse=True,
+    )
 
 
 @login_required(login_url="/login")
@@ -186,28 +321,57 @@ def watchlist(request):
         listing_id = request.POST.get("listing_id")
         listing = Listing.objects.get(id=listing_id)
 
-        # Check if item is to be added or removed
+        # Check if item is to be added or removed (closed listings cannot be watched)
         if request.POST.get("watchlist") == "add":
-            listing.watchers.add(request.user)
+            if not listing.is_closed:
+                listing.watchers.add(request.user)
             return HttpResponseRedirect(reverse("listing", args=(listing.id,)))
         elif request.POST.get("watchlist") == "remove":
             listing.watchers.remove(request.user)
             return HttpResponseRedirect(reverse("listing", args=(listing.id,)))
 
     # User accessing his watchlist page
+    # Closing a listing removes it from watchlists, so this is a single query
     else:
-        # Remove all watchers from closed listings
-        closed_listings = Listing.objects.filter(is_closed=True)
-        for listing in closed_listings:
-            listing.watchers.clear()
-
         return render(
             request,
             "auctions/watchlist.html",
-            {"watchlist": request.user.watchlist.all()},
+            {"watchlist": request.user.watchlist.filter(is_closed=False).select_related("creator")},
         )
 
 
+def comments_page(listing_id, cursor):
+    """
+    Returns a page of a listing's comments, newest first, as a dict of the
+    `comments` with their commentors and the `next` page's cursor.
+    """
+    comments = Comment.objects.filter(listing_id=listing_id).select_related("commentor")
+    page, next_cursor = keyset_page(
+        comments, cursor, getattr(settings, "AUCTIONS_COMMENTS_PAGE_SIZE", 10)
+    )
+    return {"comments": page, "next": next_cursor}
+
+
+def comments(request, listing_id):
+    """
+    API route that returns a listing's comments as JSON, one page at a time,
+    newest first. Pass the `next` cursor of a page as `cursor` to get the next.
+    """
+    page = comments_page(listing_id, request.GET.get("cursor"))
+    return JsonResponse({
+        "comments": [
+            {
+                "id": comment.id,
+                "commentor": comment.commentor.username,
+                "comment": comment.comment,
+                "created": comment.created.isoformat(),
+            }
+            for comment in page["comments"]
+        ],
+        "next": page["next"],
+    })
+
+
 @login_required(login_url="/login")
 def comment(request, listing_id):
     """